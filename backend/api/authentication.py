@@ -0,0 +1,94 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from core.utils import get_version, peek_version
+
+
+class TokenCache:
+    """
+    LRU ключ токена -> (пользователь, токен) со сроком жизни записей.
+
+    Кэш и счётчики свои у каждого процесса.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry_version, expires, value = entry
+                if entry_version == version and expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, version, value):
+        with self.lock:
+            self.entries[key] = (version, time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+            }
+
+
+token_cache = TokenCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к базе для недавно виденных токенов.
+
+    Запись сверяется с версией token:<ключ> в общем кэше, её меняют
+    удаление токена (выход) и сохранение пользователя (смена пароля,
+    деактивация). Версия читается до запроса к базе, поэтому запись
+    не переживёт изменение, случившееся во время её получения.
+    Версия создаётся только для найденного в базе токена: перебор
+    несуществующих ключей не оставляет записей в общем кэше. Ответ,
+    полученный без версии, не кэшируется - её ещё не было при запросе
+    к базе, а вытесненная версия создаётся заново с текущим временем
+    и даёт промах, а не совпадение None с None.
+    """
+
+    def authenticate_credentials(self, key):
+        name = f'token:{key}'
+        version = peek_version(name)
+        entry = None if version is None else token_cache.get(key, version)
+        if entry is None:
+            entry = super().authenticate_credentials(key)
+            if version is None:
+                get_version(name)
+            else:
+                token_cache.set(key, version, entry)
+        user, token = entry
+        # Представления меняют request.user, общий объект кэша не отдаём.
+        return copy.copy(user), token
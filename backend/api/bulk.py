@@ -0,0 +1,136 @@
+from django.db import connection, transaction
+
+from core.utils import change_counter
+from recipes.models import Recipe, ShoppingCart, ShoppingListItem
+from recipes.signals import RECIPE_COUNTERS
+
+CREATED = 'created'
+DELETED = 'deleted'
+EXISTS = 'exists'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+
+
+def existing_recipes(recipe_ids, lock=False):
+    """
+    Id существующих рецептов из recipe_ids.
+
+    С lock строки рецептов блокируются до конца транзакции (FOR NO KEY
+    UPDATE): удаление рецепта дождётся вставки, и внешний ключ не
+    нарушится при коммите. Вставки других пользователей (FOR KEY SHARE
+    проверки внешнего ключа) эта блокировка не держит. SQLite её
+    пропускает: там запись и так идёт по одной.
+    """
+    recipes = Recipe.objects.filter(id__in=recipe_ids)
+    if lock:
+        recipes = recipes.select_for_update(no_key=True).order_by('id')
+    else:
+        recipes = recipes.order_by()
+    return set(recipes.values_list('id', flat=True))
+
+
+def user_recipe_columns(model):
+    quote = connection.ops.quote_name
+    return (
+        quote(model._meta.db_table),
+        quote(model._meta.get_field('user').column),
+        quote(model._meta.get_field('recipe').column),
+    )
+
+
+def insert_recipes(model, user, recipe_ids):
+    """
+    Добавляет строки user - рецепт и возвращает id рецептов, строки
+    которых вставил именно этот запрос: INSERT ... ON CONFLICT DO
+    NOTHING RETURNING (PostgreSQL, SQLite 3.35+). Строки, добавленные
+    конкурентным запросом, в результат не попадают.
+    """
+    if not recipe_ids:
+        return set()
+    table, user_column, recipe_column = user_recipe_columns(model)
+    values = ', '.join(['(%s, %s)'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user_column}, {recipe_column}) '
+            f'VALUES {values} ON CONFLICT DO NOTHING '
+            f'RETURNING {recipe_column}',
+            [
+                value for recipe_id in recipe_ids
+                for value in (user.id, recipe_id)
+            ]
+        )
+        return {recipe_id for recipe_id, in cursor.fetchall()}
+
+
+def delete_recipes(model, user, recipe_ids):
+    """Удаляет строки user - рецепт, возвращает id действительно удалённых."""
+    if not recipe_ids:
+        return set()
+    table, user_column, recipe_column = user_recipe_columns(model)
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {user_column} = %s '
+            f'AND {recipe_column} IN ({placeholders}) '
+            f'RETURNING {recipe_column}',
+            [user.id, *recipe_ids]
+        )
+        return {recipe_id for recipe_id, in cursor.fetchall()}
+
+
+def apply_changes(model, user, recipe_ids, sign):
+    """
+    То, что для одиночных записей делают сигналы recipes.signals:
+    счётчик рецептов и список покупок.
+    """
+    if not recipe_ids:
+        return
+    change_counter(
+        Recipe.objects.filter(pk__in=recipe_ids), RECIPE_COUNTERS[model], sign
+    )
+    if model is ShoppingCart:
+        ShoppingListItem.objects.apply_recipes((user.id,), recipe_ids, sign)
+
+
+def bulk_add(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину, результат по каждому id."""
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    with transaction.atomic():
+        found = existing_recipes(recipe_ids, lock=True)
+        added = insert_recipes(
+            model, user, [
+                recipe_id for recipe_id in recipe_ids if recipe_id in found
+            ]
+        )
+        apply_changes(model, user, added, 1)
+    return [
+        {
+            'id': recipe_id,
+            'status': NOT_FOUND if recipe_id not in found
+            else CREATED if recipe_id in added else EXISTS
+        }
+        for recipe_id in recipe_ids
+    ]
+
+
+def bulk_remove(model, user, recipe_ids):
+    """Убирает рецепты из избранного или корзины, результат по каждому id."""
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    with transaction.atomic():
+        found = existing_recipes(recipe_ids)
+        # Удаление без сигналов: их работу делает apply_changes, и только
+        # для строк, которые удалил этот запрос.
+        removed = delete_recipes(
+            model, user, [
+                recipe_id for recipe_id in recipe_ids if recipe_id in found
+            ]
+        )
+        apply_changes(model, user, removed, -1)
+    return [
+        {
+            'id': recipe_id,
+            'status': NOT_FOUND if recipe_id not in found
+            else DELETED if recipe_id in removed else MISSING
+        }
+        for recipe_id in recipe_ids
+    ]
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from uuid import uuid4
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
+from .querysets import RECIPE_FRAGMENT_PREFETCH, shopping_list_rows
+from .renderers import SHOPPING_LIST_RENDERERS
+from .serializers import EXPORT_FORMATS, RecipeFragmentSerializer
+from core.utils import get_versions
+from recipes.models import ExportJob, Recipe
+
+SHOPPING_LIST_FORMATS = {
+    renderer.format: renderer for renderer in SHOPPING_LIST_RENDERERS
+}
+COOKBOOK_EXCLUDED_FIELDS = ('image_thumb', 'image_srcset')
+
+logger = logging.getLogger(__name__)
+
+
+def favorite_recipes(user):
+    return Recipe.objects.filter(
+        favorite_recipe__user=user
+    ).order_by('name', 'id')
+
+
+def export_fingerprint(user, kind, file_format):
+    """
+    Отпечаток данных, из которых собирается выгрузка.
+
+    Совпадает, пока не изменились список покупок (или избранное)
+    пользователя и версии входящих в выгрузку данных.
+    """
+    if kind == ExportJob.SHOPPING_LIST:
+        state = list(user.shopping_list.order_by(
+            'ingredient_id'
+        ).values_list('ingredient_id', 'total_amount'))
+        versions = get_versions(('ingredients',))
+    else:
+        recipes = list(favorite_recipes(user).values_list('id', 'author_id'))
+        state = [recipe_id for recipe_id, _ in recipes]
+        versions = get_versions({
+            'tags', 'ingredients',
+            *(f'recipe:{recipe_id}' for recipe_id, _ in recipes),
+            *(f'user:{author_id}' for _, author_id in recipes),
+        })
+    payload = json.dumps([kind, file_format, state, sorted(versions.items())])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def enqueue_export(user, kind, format):
+    """
+    Ставит выгрузку в очередь.
+
+    Если такая же выгрузка уже стоит в очереди или готова,
+    возвращается она. Второй элемент результата - создано ли задание.
+    """
+    fingerprint = export_fingerprint(user, kind, format)
+    jobs = user.export_jobs.exclude(status=ExportJob.FAILED)
+    job = jobs.filter(fingerprint=fingerprint).first()
+    if job is not None:
+        return job, False
+    try:
+        with transaction.atomic():
+            return ExportJob.objects.create(
+                user=user, kind=kind, format=format, fingerprint=fingerprint
+            ), True
+    except IntegrityError:
+        return jobs.get(fingerprint=fingerprint), False
+
+
+def claim_jobs(limit):
+    """Забирает из очереди до limit заданий, id в порядке создания."""
+    claimed = []
+    pending = ExportJob.objects.filter(status=ExportJob.PENDING)
+    for job_id in pending.order_by('created').values_list(
+        'id', flat=True
+    )[:limit]:
+        if pending.filter(pk=job_id).update(
+            status=ExportJob.RUNNING, started=timezone.now()
+        ):
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale_jobs(timeout):
+    """Возвращает в очередь задания, брошенные упавшим обработчиком."""
+    return ExportJob.objects.filter(
+        status=ExportJob.RUNNING,
+        started__lt=timezone.now() - timedelta(seconds=timeout),
+    ).update(status=ExportJob.PENDING, started=None)
+
+
+def render_shopping_list(job, file):
+    renderer = SHOPPING_LIST_FORMATS[job.format]()
+    for chunk in renderer.stream(shopping_list_rows(job.user).iterator()):
+        file.write(
+            chunk.encode(renderer.charset) if renderer.charset else chunk
+        )
+    return renderer.filename
+
+
+def render_cookbook(job, file):
+    """
+    ZIP с recipes.json и изображениями избранных рецептов.
+
+    Кэш фрагментов не используется: у обработчика может быть
+    свой кэш, версии в котором не обновляются.
+    """
+    recipes = list(favorite_recipes(job.user))
+    prefetch_related_objects(recipes, *RECIPE_FRAGMENT_PREFETCH)
+    cookbook = []
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for recipe in recipes:
+            data = RecipeFragmentSerializer(recipe).data
+            for field in COOKBOOK_EXCLUDED_FIELDS:
+                data.pop(field, None)
+            data['image'] = None
+            if recipe.image:
+                name = 'images/{}{}'.format(
+                    recipe.id, os.path.splitext(recipe.image.name)[1]
+                )
+                with default_storage.open(recipe.image.name) as image:
+                    with archive.open(zipfile.ZipInfo(name), 'w') as target:
+                        shutil.copyfileobj(image, target)
+                data['image'] = name
+            cookbook.append(data)
+        archive.writestr(
+            'recipes.json',
+            json.dumps(cookbook, ensure_ascii=False, indent=2)
+        )
+    return f'cookbook.{EXPORT_FORMATS[ExportJob.COOKBOOK][0]}'
+
+
+def run_export(job_id):
+    """Собирает файл выгрузки, вызывается в процессе обработчика."""
+    job = ExportJob.objects.select_related('user').get(pk=job_id)
+    render = (
+        render_shopping_list if job.kind == ExportJob.SHOPPING_LIST
+        else render_cookbook
+    )
+    try:
+        with tempfile.TemporaryFile() as file:
+            filename = render(job, file)
+            job.file.save(f'{uuid4().hex}/{filename}', File(file), save=False)
+        job.status = ExportJob.DONE
+    except Exception as error:
+        logger.exception('Не удалось выполнить выгрузку %s', job_id)
+        job.status = ExportJob.FAILED
+        job.error = str(error)
+    job.finished = timezone.now()
+    job.save(update_fields=('file', 'status', 'error', 'finished'))
+    return job.status
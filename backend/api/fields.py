@@ -1,5 +1,10 @@
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
 
 class Base64ImageField(Base64ImageField):
@@ -8,3 +13,114 @@ class Base64ImageField(Base64ImageField):
         if not base64_data:
             raise serializers.ValidationError("This field could not be empty")
         return super().to_internal_value(base64_data)
+
+
+class ImageThumbField(serializers.ReadOnlyField):
+    """Миниатюра изображения рецепта или оригинал, пока её нет."""
+
+    def get_attribute(self, instance):
+        return instance
+
+    def to_representation(self, recipe):
+        thumb = (recipe.image_variants or {}).get('thumb')
+        if thumb:
+            url = default_storage.url(thumb)
+        elif recipe.image:
+            url = recipe.image.url
+        else:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class ImageSrcsetField(serializers.ReadOnlyField):
+    """Значение srcset из WebP-вариантов изображения рецепта."""
+
+    def get_attribute(self, instance):
+        return instance
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        return ', '.join(
+            '{} {}w'.format(
+                request.build_absolute_uri(default_storage.url(name))
+                if request else default_storage.url(name),
+                width
+            )
+            for name, width in (recipe.image_variants or {}).get(
+                'srcset', ()
+            )
+        )
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который может получить объекты для
+    нескольких значений одним запросом id__in.
+
+    С many=True это делается само, во вложенных списках - через
+    BulkRelatedListSerializer.
+    """
+
+    prefetched = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except ValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    @contextmanager
+    def prefetch(self, values):
+        """Загружает объекты для всех values, пока открыт контекст."""
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except serializers.ValidationError:
+                continue
+        self.prefetched = self.get_queryset().in_bulk(pks)
+        try:
+            yield
+        finally:
+            self.prefetched = None
+
+    def to_internal_value(self, data):
+        if self.prefetched is None:
+            return super().to_internal_value(data)
+        pk = self.to_pk(data)
+        if pk not in self.prefetched:
+            self.fail('does_not_exist', pk_value=data)
+        return self.prefetched[pk]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список объектов по ключам: один запрос и все ошибки разом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        objects, errors = [], []
+        with self.child_relation.prefetch(data):
+            for item in data:
+                try:
+                    objects.append(
+                        self.child_relation.to_internal_value(item)
+                    )
+                except serializers.ValidationError as error:
+                    errors.extend(error.detail)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return objects
@@ -1,19 +1,19 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe
+from rest_framework.filters import OrderingFilter
 
+from .reference import get_tag_ids
+from recipes.models import Recipe
 
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class RecipeFilter(FilterSet):
     author = filters.CharFilter()
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug', lookup_expr='contains'
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='filter_tags'
     )
     is_favorited = filters.NumberFilter(
         method='filter_is_favorited'
@@ -21,21 +21,63 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         fields = (
-            'tags', 'author', 'is_favorited', 'is_in_shopping_cart'
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search'
         )
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов.
+
+        Слаги проверены по кэшированному словарю тегов, поэтому
+        фильтр - один EXISTS по id тегов без JOIN с таблицей тегов.
+        """
+        tag_ids = get_tag_ids()
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=[tag_ids[slug] for slug in value],
+            )
+        ))
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorite_recipe__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shopping_cart__user=user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """
+    Сортировка по параметру ordering.
+
+    Поля из ordering представления дописываются в конец, чтобы
+    порядок был однозначным. Без параметра queryset не меняется,
+    и поиск сохраняет сортировку по релевантности.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        names = {field.lstrip('-') for field in ordering}
+        return ordering + [
+            field for field in view.ordering
+            if field.lstrip('-') not in names
+        ]
+
+    def filter_queryset(self, request, queryset, view):
+        if self.ordering_param not in request.query_params:
+            return queryset
+        return super().filter_queryset(request, queryset, view)
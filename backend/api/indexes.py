@@ -0,0 +1,245 @@
+import abc
+import json
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from core.utils import bump_version, get_changes, get_version, log_changes
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: регистр и ё/е не важны."""
+    return value.casefold().replace('ё', 'е')
+
+
+def build_postings(rows):
+    """
+    Списки ключ -> рецепты (array('I')) и рецепт -> ключи по парам
+    (ключ, рецепт), упорядоченным по ключу и рецепту.
+    """
+    postings = defaultdict(lambda: array('I'))
+    keys = defaultdict(list)
+    for key, recipe_id in rows:
+        postings[key].append(recipe_id)
+        keys[recipe_id].append(key)
+    return dict(postings), {
+        recipe_id: tuple(recipe_keys)
+        for recipe_id, recipe_keys in keys.items()
+    }
+
+
+def patch_postings(postings, keys, recipe_ids, rows):
+    """
+    Копии postings и keys, в которых списки рецептов recipe_ids
+    заменены парами rows. Пересобираются только затронутые списки.
+    """
+    new_keys = defaultdict(list)
+    added = defaultdict(list)
+    for key, recipe_id in rows:
+        new_keys[recipe_id].append(key)
+        added[key].append(recipe_id)
+    postings = dict(postings)
+    keys = dict(keys)
+    touched = set(added)
+    for recipe_id in recipe_ids:
+        touched.update(keys.pop(recipe_id, ()))
+    for key in touched:
+        recipes = sorted(
+            [
+                recipe_id for recipe_id in postings.get(key, ())
+                if recipe_id not in recipe_ids
+            ] + added.get(key, [])
+        )
+        if recipes:
+            postings[key] = array('I', recipes)
+        else:
+            postings.pop(key, None)
+    keys.update(
+        (recipe_id, tuple(recipe_keys))
+        for recipe_id, recipe_keys in new_keys.items()
+    )
+    return postings, keys
+
+
+class VersionedIndex(abc.ABC):
+    """
+    Индекс в памяти процесса, который обновляется, когда меняется
+    общая для всех процессов версия version_name.
+    """
+
+    version_name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    @abc.abstractmethod
+    def _build(self, version):
+        """Состояние индекса, последний элемент - version."""
+
+    def _update(self, state, version):
+        """
+        Состояние для новой версии по прежнему state, который менять
+        нельзя: его могут читать другие потоки. По умолчанию индекс
+        строится заново.
+        """
+        return self._build(version)
+
+    def _get_state(self):
+        version = get_version(self.version_name)
+        state = self._state
+        if state is None or state[-1] != version:
+            with self._lock:
+                state = self._state
+                if state is None:
+                    state = self._state = self._build(version)
+                elif state[-1] != version:
+                    state = self._state = self._update(state, version)
+        return state
+
+
+class IngredientIndex(VersionedIndex):
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Ключи отсортированы, поэтому совпадения по началу названия
+    ищутся бинарным поиском, а строки ответа хранятся уже
+    сериализованными в JSON. Индекс перестраивается, когда меняется
+    общая для всех процессов версия справочника ингредиентов.
+    """
+
+    version_name = 'ingredients'
+
+    def _build(self, version):
+        entries = sorted(
+            (normalize(name), name, json.dumps(
+                {'id': pk, 'name': name, 'measurement_unit': unit},
+                ensure_ascii=False
+            ))
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).order_by()
+        )
+        keys = [key for key, _, _ in entries]
+        rows = [row for _, _, row in entries]
+        return keys, rows, version
+
+    def all(self):
+        return self._get_state()[1]
+
+    def search(self, query, limit):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        keys, rows, _ = self._get_state()
+        query = normalize(query)
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + chr(sys.maxunicode), start)
+        result = rows[start:min(end, start + limit)]
+        for position, key in enumerate(keys):
+            if len(result) >= limit:
+                break
+            if query in key and not start <= position < end:
+                result.append(rows[position])
+        return result
+
+
+class PantryIndex(VersionedIndex):
+    """
+    Инвертированные индексы ингредиент -> рецепты и тег -> рецепты.
+
+    Рецепты в списках хранятся отсортированными массивами array('I').
+    Создание и изменение состава или тегов рецептов записывают id
+    рецептов в журнал pantry и меняют версию pantry (pantry_changed).
+    По новой версии пересобираются только списки рецептов из журнала;
+    целиком индекс строится при первом обращении и тогда, когда
+    журнал неполон.
+    """
+
+    version_name = 'pantry'
+
+    def _build(self, version):
+        number, _ = get_changes(self.version_name, None)
+        postings, ingredients = build_postings(
+            RecipeIngredient.objects.order_by(
+                'ingredient_id', 'recipe_id'
+            ).values_list('ingredient_id', 'recipe_id').iterator()
+        )
+        tag_postings, tags = build_postings(
+            Recipe.tags.through.objects.order_by(
+                'tag_id', 'recipe_id'
+            ).values_list('tag_id', 'recipe_id').iterator()
+        )
+        return postings, ingredients, tag_postings, tags, number, version
+
+    def _update(self, state, version):
+        postings, ingredients, tag_postings, tags, number, _ = state
+        number, recipe_ids = get_changes(self.version_name, number)
+        if recipe_ids is None:
+            return self._build(version)
+        if recipe_ids:
+            postings, ingredients = patch_postings(
+                postings, ingredients, recipe_ids,
+                RecipeIngredient.objects.filter(
+                    recipe_id__in=recipe_ids
+                ).order_by().values_list('ingredient_id', 'recipe_id')
+            )
+            tag_postings, tags = patch_postings(
+                tag_postings, tags, recipe_ids,
+                Recipe.tags.through.objects.filter(
+                    recipe_id__in=recipe_ids
+                ).order_by().values_list('tag_id', 'recipe_id')
+            )
+        return postings, ingredients, tag_postings, tags, number, version
+
+    def search(self, ingredient_ids, tag_ids=None):
+        """
+        Рецепты с хотя бы одним из ingredient_ids, по убыванию доли
+        своих ингредиентов из этого списка: (id, есть, всего).
+        """
+        postings, ingredients, tag_postings, _, _, _ = self._get_state()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        if tag_ids is not None:
+            allowed = set()
+            for tag_id in tag_ids:
+                allowed.update(tag_postings.get(tag_id, ()))
+            matched = {
+                recipe_id: count for recipe_id, count in matched.items()
+                if recipe_id in allowed
+            }
+        return sorted(
+            (
+                (recipe_id, count, len(ingredients[recipe_id]))
+                for recipe_id, count in matched.items()
+            ),
+            key=lambda row: (row[1] / row[2], row[1], row[0]),
+            reverse=True
+        )
+
+
+ingredient_index = IngredientIndex()
+pantry_index = PantryIndex()
+
+
+def pantry_changed(recipe_ids):
+    """
+    После коммита записывает recipe_ids в журнал pantry (None -
+    неизвестно какие рецепты) и меняет версию индекса.
+    """
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+
+    def bump():
+        log_changes('pantry', recipe_ids)
+        bump_version('pantry')
+
+    transaction.on_commit(bump)
+
+
+def render_rows(rows):
+    return '[' + ','.join(rows) + ']'
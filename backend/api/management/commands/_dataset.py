@@ -0,0 +1,149 @@
+import io
+import random
+from contextlib import contextmanager
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import override_settings
+
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+)
+from recipes.units import create_units
+from users.models import Subscription, User
+
+WORDS = (
+    'суп', 'борщ', 'салат', 'пирог', 'каша', 'рагу', 'омлет', 'паста',
+    'запеканка', 'блины', 'курица', 'говядина', 'грибы', 'сыр', 'томат',
+)
+WEIGHT_UNITS = ('г', 'кг')
+
+
+@contextmanager
+def test_database():
+    """Временная тестовая база и локальный кэш на время замеров."""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            CACHES={
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+                },
+                'versions': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': 'versions',
+                },
+            },
+        ):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_dataset(recipes_count):
+    """Детерминированные тестовые данные, ANALYZE в конце."""
+    rng = random.Random(0)
+    users_count = max(recipes_count // 10, 10)
+    User.objects.bulk_create(
+        User(
+            username=f'user{number}', email=f'user{number}@example.com',
+            first_name='Имя', last_name='Фамилия', password='!'
+        )
+        for number in range(users_count)
+    )
+    user_ids = list(User.objects.values_list('id', flat=True))
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {number}', slug=f'tag{number}',
+            color=f'#{number:06x}')
+        for number in range(10)
+    )
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    create_units(WEIGHT_UNITS)
+    Ingredient.objects.bulk_create(
+        Ingredient(
+            name=f'ингредиент {number // 2}',
+            measurement_unit_id=WEIGHT_UNITS[number % 2]
+        )
+        for number in range(2000)
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                name=' '.join(rng.sample(WORDS, 3)),
+                text=' '.join(rng.choices(WORDS, k=30)),
+                cooking_time=rng.randint(5, 180),
+                image='rescipes/images/seed.png',
+                author_id=rng.choice(user_ids[:users_count // 5]),
+            )
+            for _ in range(recipes_count)
+        ),
+        batch_size=1000,
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(ingredient_ids, 6)
+        ),
+        batch_size=5000,
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, 2)
+        ),
+        batch_size=5000,
+    )
+    for model, count in ((Favorite, 20), (ShoppingCart, 5)):
+        model.objects.bulk_create(
+            (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in rng.sample(recipe_ids, count)
+            ),
+            batch_size=5000,
+        )
+    Subscription.objects.bulk_create(
+        (
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in rng.sample(user_ids[:users_count // 5], 10)
+            if author_id != user_id
+        ),
+        batch_size=5000,
+    )
+    for command in (
+        'rebuild_shopping_lists', 'reconcile_counters', 'rebuild_feeds',
+        'build_similar_recipes',
+    ):
+        call_command(command, stdout=io.StringIO())
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    user = User.objects.get(pk=user_ids[0])
+    subscribed = user.subscriber.values('author')
+    free_recipes = Recipe.objects.exclude(
+        favorite_recipe__user=user
+    ).exclude(shopping_cart__user=user).values_list('id', flat=True)
+    return {
+        'user': user,
+        'author': User.objects.exclude(pk=user.pk).exclude(
+            pk__in=subscribed
+        ).order_by('-recipes_count').values_list('id', flat=True)[0],
+        'recipe': free_recipes[0],
+        'recipes': list(free_recipes[1:21]),
+        'tag': tag_ids[0],
+        'ingredient': ingredient_ids[0],
+        'pantry': list(RecipeIngredient.objects.filter(
+            recipe_id=free_recipes[0]
+        ).values_list('ingredient_id', flat=True)),
+    }
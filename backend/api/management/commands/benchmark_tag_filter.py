@@ -0,0 +1,103 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.http import QueryDict
+from django_filters.rest_framework import filters
+
+from ._dataset import seed_dataset, test_database
+from api.filters import RecipeFilter
+from api.querysets import recipe_read_queryset
+from recipes.models import Recipe
+
+PAGE_SIZE = 6
+TAG_COMBINATIONS = (1, 2, 3, 5)
+
+
+class PreviousRecipeFilter(RecipeFilter):
+    """Прежний фильтр тегов: tags__slug__contains по каждому слагу."""
+
+    tags = filters.AllValuesMultipleFilter(
+        field_name='tags__slug', lookup_expr='contains'
+    )
+
+
+def filter_feed(filterset_class, user, slugs):
+    data = QueryDict(mutable=True)
+    data.setlist('tags', slugs)
+    filterset = filterset_class(
+        data, queryset=recipe_read_queryset(user, Recipe.objects.all())
+    )
+    if not filterset.is_valid():
+        raise CommandError(filterset.errors)
+    return filterset.qs
+
+
+def previous_feed(user, slugs):
+    """
+    Прежняя лента: выбор всех слагов для AllValuesMultipleFilter,
+    JOIN с тегами по условиям, объединённым через OR, и DISTINCT,
+    который django-filter добавляет по умолчанию.
+    """
+    return filter_feed(PreviousRecipeFilter, user, slugs)
+
+
+def current_feed(user, slugs):
+    return filter_feed(RecipeFilter, user, slugs)
+
+
+def measure(feed, user, slugs, repeat):
+    timings, ids = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        queryset = feed(user, slugs)
+        queryset.count()
+        ids = [recipe.id for recipe in queryset[:PAGE_SIZE]]
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), ids
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время ленты рецептов с фильтром по нескольким '
+        'тегам до и после замены AllValuesMultipleFilter.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=20000,
+            help='Число рецептов в тестовых данных.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Число повторов каждого замера.',
+        )
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.stdout.write(
+                f'Заполнение тестовой базы: {options["recipes"]} рецептов...'
+            )
+            context = seed_dataset(options['recipes'])
+            slugs = [f'tag{number}' for number in range(max(TAG_COMBINATIONS))]
+            for count in TAG_COMBINATIONS:
+                before, before_ids = measure(
+                    previous_feed, context['user'], slugs[:count],
+                    options['repeat']
+                )
+                after, after_ids = measure(
+                    current_feed, context['user'], slugs[:count],
+                    options['repeat']
+                )
+                if before_ids != after_ids:
+                    raise CommandError(
+                        f'Тегов {count}: результаты различаются.'
+                    )
+                self.stdout.write(
+                    f'Тегов {count}: до {before:.1f} мс, '
+                    f'после {after:.1f} мс ({before / after:.1f}x).'
+                )
@@ -0,0 +1,342 @@
+import json
+import re
+from pathlib import Path
+
+from django.core.cache import cache, caches
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from ._dataset import seed_dataset, test_database
+from api import urls
+from api.authentication import token_cache
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from users.models import User
+
+BASELINE_DIR = Path(__file__).resolve().parents[2] / 'query_plans'
+PROTECTED_TABLES = (
+    Recipe._meta.db_table,
+    Favorite._meta.db_table,
+    ShoppingCart._meta.db_table,
+    RecipeIngredient._meta.db_table,
+)
+DEFAULT_RECIPES_COUNT = 20000
+PASSWORD = 'query-plans-Password1'
+ROWS_TOLERANCE = 10
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+IGNORED_ROUTES = {
+    'api-root', 'users-activation', 'users-resend-activation',
+    'users-reset-password', 'users-reset-password-confirm',
+    'users-reset-username', 'users-reset-username-confirm',
+    'users-set-username',
+}
+SQLITE_SCAN = re.compile(
+    r'^(?P<op>SCAN|SEARCH) (?P<table>\w+)(?: AS \w+)?'
+    r'(?: USING (?:COVERING )?INDEX (?P<index>\w+)'
+    r'| USING (?P<pk>(?:INTEGER )?PRIMARY KEY))?'
+)
+# Ключ, метод, имя маршрута, аргументы, параметры запроса, пользователь.
+ENDPOINTS = (
+    ('recipes', 'get', 'recipes-list', {}, {}, None),
+    ('recipes auth', 'get', 'recipes-list', {}, {}, 'user'),
+    ('recipes tags', 'get', 'recipes-list', {},
+     {'tags': ['tag0', 'tag1']}, 'user'),
+    ('recipes author', 'get', 'recipes-list', {}, {'author': 'author'}, None),
+    ('recipes favorited', 'get', 'recipes-list', {},
+     {'is_favorited': 1}, 'user'),
+    ('recipes in cart', 'get', 'recipes-list', {},
+     {'is_in_shopping_cart': 1}, 'user'),
+    ('recipes search', 'get', 'recipes-list', {}, {'search': 'суп'}, None),
+    ('recipes popular', 'get', 'recipes-list', {},
+     {'ordering': '-favorites_count'}, None),
+    ('recipes cursor', 'get', 'recipes-list', {}, {'cursor': ''}, None),
+    ('recipes feed', 'get', 'recipes-feed', {}, {}, 'user'),
+    ('recipes feed cursor', 'get', 'recipes-feed', {}, {'cursor': ''},
+     'user'),
+    ('recipe', 'get', 'recipes-detail', {'pk': 'recipe'}, {}, 'user'),
+    ('recipe similar', 'get', 'recipes-similar', {'pk': 'recipe'}, {},
+     None),
+    ('recipes pantry', 'get', 'recipes-pantry', {},
+     {'ingredients': 'pantry'}, 'user'),
+    ('recipes pantry tags', 'get', 'recipes-pantry', {},
+     {'ingredients': 'pantry', 'tags': ['tag0', 'tag1']}, 'user'),
+    ('favorite add', 'post', 'recipes-favorite', {'pk': 'recipe'}, {},
+     'user'),
+    ('favorite remove', 'delete', 'recipes-favorite', {'pk': 'recipe'}, {},
+     'user'),
+    ('cart add', 'post', 'recipes-shopping-cart', {'pk': 'recipe'}, {},
+     'user'),
+    ('cart remove', 'delete', 'recipes-shopping-cart', {'pk': 'recipe'}, {},
+     'user'),
+    ('favorite bulk add', 'post', 'recipes-favorite-bulk', {},
+     {'recipes': 'recipes'}, 'user'),
+    ('favorite bulk remove', 'delete', 'recipes-favorite-bulk', {},
+     {'recipes': 'recipes'}, 'user'),
+    ('cart bulk add', 'post', 'recipes-shopping-cart-bulk', {},
+     {'recipes': 'recipes'}, 'user'),
+    ('cart bulk remove', 'delete', 'recipes-shopping-cart-bulk', {},
+     {'recipes': 'recipes'}, 'user'),
+    ('cart download', 'get', 'recipes-download-shopping-cart', {}, {},
+     'user'),
+    ('cart totals', 'get', 'recipes-shopping-cart-totals', {}, {}, 'user'),
+    ('users', 'get', 'users-list', {}, {}, 'user'),
+    ('user', 'get', 'users-detail', {'id': 'author'}, {}, 'user'),
+    ('me', 'get', 'users-me', {}, {}, 'user'),
+    ('set password', 'post', 'users-set-password', {},
+     {'current_password': 'password', 'new_password': 'password'}, 'user'),
+    ('subscribe', 'post', 'users-subscribe', {'id': 'author'}, {}, 'user'),
+    ('unsubscribe', 'delete', 'users-subscribe', {'id': 'author'}, {},
+     'user'),
+    ('subscriptions', 'get', 'subscription-list', {},
+     {'recipes_limit': 3}, 'user'),
+    ('token cache', 'get', 'token-cache', {}, {}, 'admin'),
+    ('tags', 'get', 'tags-list', {}, {}, None),
+    ('tag', 'get', 'tags-detail', {'pk': 'tag'}, {}, None),
+    ('ingredients', 'get', 'ingredients-list', {}, {'name': 'ингр'}, None),
+    ('ingredient', 'get', 'ingredients-detail', {'pk': 'ingredient'}, {},
+     None),
+    ('reference', 'get', 'reference', {}, {}, None),
+    ('exports', 'get', 'exports-list', {}, {}, 'user'),
+    ('export add', 'post', 'exports-list', {},
+     {'kind': 'shopping_list'}, 'user'),
+    ('export', 'get', 'exports-detail', {'pk': 'export'}, {}, 'user'),
+)
+
+
+def api_routes(patterns, prefix=''):
+    """Имена маршрутов api/urls.py, которые обслуживает api.views."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from api_routes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            view = getattr(pattern.callback, 'cls', pattern.callback)
+            if view.__module__ == 'api.views':
+                yield pattern.name
+
+
+def sqlite_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    scans = []
+    for detail in details:
+        match = SQLITE_SCAN.match(detail)
+        if not match:
+            continue
+        if match['index'] or match['pk']:
+            scan = f'{match["table"]}:index:{match["index"] or "pk"}'
+        elif match['op'] == 'SEARCH':
+            scan = f'{match["table"]}:index:auto'
+        else:
+            scan = f'{match["table"]}:seq'
+        scans.append(scan)
+    return {'scans': sorted(set(scans)), 'rows': None}
+
+
+def postgresql_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    plan = plan[0]['Plan']
+    scans, nodes = set(), [(plan, None)]
+    while nodes:
+        node, relation = nodes.pop()
+        # Bitmap Index Scan не знает таблицу, она есть у родителя.
+        relation = node.get('Relation Name', relation)
+        nodes.extend((child, relation) for child in node.get('Plans', ()))
+        if node['Node Type'] == 'Seq Scan':
+            scans.add(f'{relation}:seq')
+        elif 'Index Name' in node:
+            scans.add(f'{relation}:index:{node["Index Name"]}')
+    return {'scans': sorted(scans), 'rows': plan['Plan Rows']}
+
+
+def explain(sql):
+    if connection.vendor == 'postgresql':
+        return postgresql_plan(sql)
+    return sqlite_plan(sql)
+
+
+def compare(key, baseline, plans):
+    """Регрессии планов эндпоинта key относительно базовой линии."""
+    if len(baseline) != len(plans):
+        return [
+            f'{key}: запросов {len(plans)}, в базовой линии {len(baseline)}'
+        ]
+    problems = []
+    for number, (old, new) in enumerate(zip(baseline, plans), start=1):
+        for scan in set(new['scans']) - set(old['scans']):
+            table, kind = scan.split(':')[:2]
+            if kind == 'seq' and table in PROTECTED_TABLES:
+                problems.append(
+                    f'{key}, запрос {number}: полный просмотр {table}'
+                )
+        for scan in set(old['scans']) - set(new['scans']):
+            if ':index:' in scan:
+                problems.append(
+                    f'{key}, запрос {number}: не используется {scan}'
+                )
+        if old['rows'] and new['rows'] and max(
+            old['rows'] / new['rows'], new['rows'] / old['rows']
+        ) > ROWS_TOLERANCE:
+            problems.append(
+                f'{key}, запрос {number}: оценка строк {new["rows"]}, '
+                f'в базовой линии {old["rows"]}'
+            )
+    return problems
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет тестовую базу данными реалистичного объёма, '
+        'выполняет запросы ко всем эндпоинтам API и сверяет планы '
+        'выполнения (EXPLAIN) с сохранённой базовой линией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            help=(
+                'Число рецептов в тестовых данных, по умолчанию '
+                'как в базовой линии.'
+            ),
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Сохранить текущие планы как базовую линию.',
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Вывести планы всех запросов.',
+        )
+
+    def request(self, context, method, name, kwargs, params, user):
+        client = APIClient()
+        if user:
+            client.credentials(
+                HTTP_AUTHORIZATION=f'Token {context["tokens"][user]}'
+            )
+        url = reverse(f'api:{name}', kwargs={
+            key: context[value] for key, value in kwargs.items()
+        })
+        params = {
+            key: context.get(value, value) if isinstance(value, str)
+            else value
+            for key, value in params.items()
+        }
+        if method == 'get':
+            response = client.get(url, params)
+        else:
+            response = getattr(client, method)(url, params, format='json')
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {url}: {response}')
+        if response.streaming:
+            # Запросы потоковых ответов выполняются при чтении тела.
+            b''.join(response.streaming_content)
+        if name == 'exports-list' and method == 'post':
+            context['export'] = response.data['id']
+        return response
+
+    def prepare_auth(self, context):
+        """
+        Пароль и токены для запросов с настоящей аутентификацией,
+        чтобы в планы попадал и поиск токена.
+        """
+        context['user'].set_password(PASSWORD)
+        context['user'].save(update_fields=['password'])
+        context['password'] = PASSWORD
+        context['admin'] = User.objects.create(
+            username='query-plans-admin', email='admin@example.com',
+            password='!', is_staff=True
+        )
+        context['tokens'] = {
+            name: Token.objects.get_or_create(user=context[name])[0].key
+            for name in ('user', 'admin')
+        }
+
+    def collect_plans(self, context):
+        plans = {}
+        self.prepare_auth(context)
+        for key, method, name, kwargs, params, user in ENDPOINTS:
+            cache.clear()
+            caches['versions'].clear()
+            token_cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.request(context, method, name, kwargs, params, user)
+            plans[key] = [
+                explain(query['sql'])
+                for query in queries.captured_queries
+                if query['sql'].lstrip().upper().startswith(
+                    EXPLAINED_STATEMENTS
+                )
+            ]
+        return plans
+
+    def run_checks(self, options):
+        covered = {name for _, _, name, _, _, _ in ENDPOINTS}
+        uncovered = set(api_routes(urls.urlpatterns)) - covered - (
+            IGNORED_ROUTES
+        )
+        if uncovered:
+            raise CommandError(
+                'Нет проверок для маршрутов: ' + ', '.join(sorted(uncovered))
+            )
+        baseline_path = BASELINE_DIR / f'{connection.vendor}.json'
+        baseline = None
+        if baseline_path.is_file():
+            baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+        elif not options['update_baseline']:
+            raise CommandError(
+                f'Нет базовой линии {baseline_path}, '
+                'запустите команду с --update-baseline.'
+            )
+        recipes_count = options['recipes'] or (
+            baseline['recipes'] if baseline else DEFAULT_RECIPES_COUNT
+        )
+        self.stdout.write(
+            f'Заполнение тестовой базы: {recipes_count} рецептов...'
+        )
+        plans = self.collect_plans(seed_dataset(recipes_count))
+        if options['verbose_plans']:
+            for key, queries in plans.items():
+                for number, plan in enumerate(queries, start=1):
+                    self.stdout.write(
+                        f'{key} #{number}: {", ".join(plan["scans"])} '
+                        f'(строк: {plan["rows"]})'
+                    )
+        if options['update_baseline']:
+            BASELINE_DIR.mkdir(exist_ok=True)
+            baseline_path.write_text(json.dumps(
+                {'recipes': recipes_count, 'plans': plans},
+                ensure_ascii=False, indent=2
+            ) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовая линия сохранена в {baseline_path}.'
+            ))
+            return
+        problems = []
+        for key, queries in plans.items():
+            if key in baseline['plans']:
+                problems.extend(compare(key, baseline['plans'][key], queries))
+            else:
+                problems.append(f'{key}: нет в базовой линии')
+        if problems:
+            raise CommandError(
+                'Регрессии планов запросов:\n' + '\n'.join(problems)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Планы {sum(map(len, plans.values()))} запросов '
+            f'{len(plans)} эндпоинтов совпадают с базовой линией.'
+        ))
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.run_checks(options)
@@ -0,0 +1,73 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management import BaseCommand
+
+from api.exports import claim_jobs, requeue_stale_jobs, run_export
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает очередь выгрузок из базы данных '
+        'в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Число процессов.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза между опросами пустой очереди, с.',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=30 * 60,
+            help='Через сколько секунд вернуть в очередь зависшее задание.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выйти, когда очередь опустеет.',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        running = {}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as executor:
+            while True:
+                requeued = requeue_stale_jobs(options['stale_after'])
+                if requeued:
+                    self.stderr.write(f'Возвращено в очередь: {requeued}.')
+                for job_id in claim_jobs(workers - len(running)):
+                    running[executor.submit(run_export, job_id)] = job_id
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, _ = wait(
+                    running,
+                    timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        self.stdout.write(
+                            f'Выгрузка {job_id}: {future.result()}.'
+                        )
+                    except Exception as error:
+                        self.stderr.write(f'Выгрузка {job_id}: {error}')
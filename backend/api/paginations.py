@@ -1,6 +1,141 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+INVALID_CURSOR_ERROR = 'Неверный курсор.'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничный вывод по ключу сортировки без COUNT и OFFSET.
+
+    Курсор хранит значения полей ordering у крайней записи
+    страницы, следующая страница выбирается условием
+    (поле1, поле2, ...) > значения курсора.
+    """
+
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+        self.page_size = page_size
+
+    def encode_cursor(self, row, reverse):
+        values = [
+            self.model._meta.get_field(name).value_to_string(row)
+            for name, _ in self.ordering
+        ]
+        cursor = json.dumps({'p': values, 'r': int(reverse)})
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode()).decode()
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(cursor.encode()))
+            values = [
+                self.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, cursor['p'])
+            ]
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return values, bool(cursor['r'])
+        except Exception:
+            raise NotFound(INVALID_CURSOR_ERROR)
+
+    def get_ordering(self, reverse):
+        return [
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.ordering
+        ]
+
+    def get_condition(self, values, reverse):
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        def fetch(values, reverse, limit):
+            rows = queryset.order_by(*self.get_ordering(reverse))
+            if values is not None:
+                rows = rows.filter(self.get_condition(values, reverse))
+            return list(rows[:limit])
+
+        return self.paginate(queryset.model, fetch, request)
+
+    def paginate(self, model, fetch, request):
+        """
+        Страница объектов model, которые выбирает
+        fetch(значения курсора или None, reverse, сколько): не больше
+        стольких строк строго после курсора в порядке ordering, а при
+        reverse - в обратном.
+        """
+        self.model = model
+        self.base_url = request.build_absolute_uri()
+        values, reverse = self.decode_cursor(request)
+        rows = fetch(values, reverse, self.page_size + 1)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        self.next = self.previous = None
+        if rows:
+            if has_more or reverse:
+                self.next = self.encode_cursor(rows[-1], reverse=False)
+            if values is not None and (has_more or not reverse):
+                self.previous = self.encode_cursor(rows[0], reverse=True)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next),
+            ('previous', self.previous),
+            ('results', data),
+        ]))
 
 
 class FoodgramPagination(PageNumberPagination):
+    """
+    Постраничный вывод по номеру страницы.
+
+    Представления с атрибутом keyset_ordering по параметру cursor
+    (для первой страницы - пустому) переключаются на KeysetPagination.
+    """
+
     page_size = 6
     page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', None)
+        self.keyset = None
+        if (
+            ordering
+            and KeysetPagination.cursor_query_param in request.query_params
+        ):
+            self.keyset = KeysetPagination(
+                ordering, self.get_page_size(request)
+            )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
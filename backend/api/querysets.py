@@ -0,0 +1,113 @@
+from django.db import connection
+from django.db.models import (
+    BooleanField, Exists, F, OuterRef, Prefetch, Sum, Value, Window
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+
+from recipes.models import Recipe, RecipeIngredient
+from users.models import Subscription, User
+
+
+def user_read_queryset(user, queryset=None):
+    """Пользователи с аннотацией подписки текущего пользователя."""
+    if queryset is None:
+        queryset = User.objects.all()
+    if not user.is_authenticated:
+        return queryset.annotate(
+            is_subscribed=Value(False, output_field=BooleanField())
+        )
+    return queryset.annotate(
+        is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('pk'))
+        )
+    )
+
+
+RECIPE_FRAGMENT_PREFETCH = (
+    'author',
+    'tags',
+    Prefetch(
+        'ingredients_recipe',
+        queryset=RecipeIngredient.objects.select_related('ingredient')
+    ),
+)
+
+
+def recipe_read_queryset(user, queryset=None):
+    """
+    Рецепты для чтения с фиксированным числом запросов.
+
+    Флаги текущего пользователя вычисляются в основном запросе.
+    Авторы, теги и ингредиенты подгружаются тремя запросами
+    RECIPE_FRAGMENT_PREFETCH и только для рецептов, которых
+    нет в кэше фрагментов.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    return queryset.with_user_flags(user)
+
+
+def recipes_preview_queryset(user, recipes_limit):
+    """
+    Первые recipes_limit рецептов каждого автора из подписок user.
+
+    Нумерация строк оконной функцией выполняется в подзапросе,
+    так как Django не позволяет фильтровать по Window напрямую.
+    """
+    ranked = Recipe.objects.filter(
+        author__subscription__user=user
+    ).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        )
+    ).order_by().values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    quote = connection.ops.quote_name
+    return Recipe.objects.filter(
+        id__in=RawSQL(
+            f'SELECT {quote("id")} FROM ({sql}) AS {quote("ranked")} '
+            f'WHERE {quote("row_number")} <= %s',
+            (*params, recipes_limit)
+        )
+    )
+
+
+def subscription_read_queryset(user, recipes_limit=None):
+    """
+    Авторы из подписок user с превью их рецептов.
+
+    Превью рецептов загружается одним запросом для всей страницы.
+    """
+    if recipes_limit is None:
+        recipes = Recipe.objects.all()
+    else:
+        recipes = recipes_preview_queryset(user, recipes_limit)
+    return user_read_queryset(
+        user, User.objects.filter(subscription__user=user)
+    ).prefetch_related(
+        Prefetch('recipes', queryset=recipes, to_attr='recipes_preview')
+    )
+
+
+def shopping_list_rows(user):
+    """
+    Строки списка покупок пользователя для рендереров.
+
+    Количества переводятся в базовые единицы измерения и суммируются
+    в том же запросе, так что "г" и "кг" одного ингредиента дают
+    одну строку.
+    """
+    return user.shopping_list.values(
+        name=F('ingredient__name'),
+        measurement_unit=Coalesce(
+            'ingredient__measurement_unit__base',
+            'ingredient__measurement_unit',
+        ),
+    ).annotate(
+        total_qty=Sum(
+            F('total_amount') * F('ingredient__measurement_unit__factor')
+        )
+    ).order_by('name', 'measurement_unit')
@@ -0,0 +1,58 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import IngredientSerializer, TagSerializer
+from core.utils import get_version
+from recipes.models import Ingredient, Tag
+
+REFERENCE_SERIALIZERS = {
+    'tags': (Tag, TagSerializer),
+    'ingredients': (Ingredient, IngredientSerializer),
+}
+REFERENCE_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_reference_content(name):
+    """JSON справочника name, отрендеренный для текущей версии."""
+    key = f'reference:{name}:{get_version(name)}'
+    content = cache.get(key)
+    if content is None:
+        model, serializer = REFERENCE_SERIALIZERS[name]
+        content = JSONRenderer().render(
+            serializer(model.objects.all(), many=True).data
+        )
+        cache.set(key, content, REFERENCE_CACHE_TIMEOUT)
+    return content
+
+
+def get_tag_ids():
+    """Словарь slug -> id тегов для текущей версии справочника."""
+    key = f'tag-ids:{get_version("tags")}'
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids, REFERENCE_CACHE_TIMEOUT)
+    return tag_ids
+
+
+def reference_etag(*names):
+    """ETag по версиям справочников и параметрам запроса."""
+    def etag_func(request, *args, **kwargs):
+        versions = '-'.join(str(get_version(name)) for name in names)
+        query = hashlib.md5(
+            request.META.get('QUERY_STRING', '').encode()
+        ).hexdigest()
+        return f'{"-".join(names)}-{versions}-{query}'
+    return etag_func
+
+
+def reference_last_modified(*names):
+    def last_modified_func(request, *args, **kwargs):
+        return datetime.fromtimestamp(
+            max(get_version(name) for name in names) / 10 ** 6,
+            tz=timezone.utc
+        )
+    return last_modified_func
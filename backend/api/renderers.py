@@ -0,0 +1,114 @@
+import csv
+import io
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+class EchoBuffer:
+    """Буфер, который сразу возвращает записанное значение."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListTextRenderer(BaseRenderer):
+    """
+    Список покупок в текстовом формате.
+
+    Рендереры списка покупок выбираются параметром ?format=,
+    а сам файл отдаётся по строкам через stream().
+    """
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    @property
+    def filename(self):
+        return f'shopping_cart.{self.format}'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Ответы с ошибками отдаются простым текстом."""
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode('utf-8')
+
+    def stream(self, ingredients):
+        for ingredient in ingredients:
+            name = ingredient['name']
+            measurement_unit = ingredient['measurement_unit']
+            amount = ingredient['total_qty']
+            yield f'{name}: {amount} {measurement_unit}\n'
+
+
+class ShoppingListCSVRenderer(ShoppingListTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(('Ингредиент', 'Количество', 'Единицы'))
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['name'],
+                ingredient['total_qty'],
+                ingredient['measurement_unit'],
+            ))
+
+
+class ShoppingListPDFRenderer(ShoppingListTextRenderer):
+    """
+    Список покупок в PDF.
+
+    Документ собирается reportlab целиком ещё до создания ответа:
+    ошибка шрифта или построения превращается в ответ с ошибкой,
+    а не в оборванный файл после статуса 200. Наружу готовый
+    документ отдаётся частями.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def build(self, ingredients):
+        if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        position = height - PDF_MARGIN
+        for line in super().stream(ingredients):
+            if position < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+                position = height - PDF_MARGIN
+            pdf.drawString(PDF_MARGIN, position, line.rstrip('\n'))
+            position -= PDF_LINE_HEIGHT
+        pdf.save()
+        buffer.seek(0)
+        return buffer
+
+    def stream(self, ingredients):
+        buffer = self.build(ingredients)
+        return iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
+
+
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListTextRenderer,
+    ShoppingListCSVRenderer,
+    ShoppingListPDFRenderer,
+)
@@ -1,13 +1,27 @@
+from collections.abc import Mapping
+from contextlib import ExitStack
+
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import exceptions, serializers
 from rest_framework.validators import UniqueValidator
 
-from .fields import Base64ImageField
-from .validators import validate_username
+from .fields import (
+    Base64ImageField, BulkPrimaryKeyRelatedField, ImageSrcsetField,
+    ImageThumbField
+)
+from .indexes import pantry_changed
+from .querysets import RECIPE_FRAGMENT_PREFETCH, recipe_read_queryset
+from .renderers import SHOPPING_LIST_RENDERERS
+from .validators import validate_recipes_limit, validate_username
 from core.enums import Length
+from core.utils import get_versions
 from recipes.models import (
-    Favorite, Ingredient, Recipe, RecipeIngredient, Tag, ShoppingCart
+    ExportJob, Favorite, Ingredient, Recipe, RecipeIngredient, Tag,
+    ShoppingCart, ShoppingListItem
 )
 from users.models import User, Subscription
 
@@ -20,6 +34,14 @@ INGREDIENTS_NOT_FOUND_ERROR = 'Количество ингредиентов н
 RECIPE_NOT_FOUND_VALIDATION_ERROR = 'Рецепт не найден в корзине.'
 RECIPE_VALIDATION_ERROR_FAVORITES = 'Рецепт уже добавлен в избранное.'
 NOT_FOUND_FIELDS_ERROR = 'Не хватает поля тэгов или ингредиентов.'
+EXPORT_FORMAT_ERROR = 'Допустимые форматы: {}.'
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+EXPORT_FORMATS = {
+    ExportJob.SHOPPING_LIST: tuple(
+        renderer.format for renderer in SHOPPING_LIST_RENDERERS
+    ),
+    ExportJob.COOKBOOK: ('zip',),
+}
 
 
 class UserGetSerializer(UserSerializer):
@@ -35,6 +57,8 @@ class UserGetSerializer(UserSerializer):
         read_only_fields = ('id', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return user.is_authenticated and obj.subscription.filter(
             user=user
@@ -67,6 +91,9 @@ class UserCreatesSerializer(UserCreateSerializer):
 
 
 class IngredientSerializer(serializers.ModelSerializer):
+    measurement_unit = serializers.ReadOnlyField(
+        source='measurement_unit_id'
+    )
 
     class Meta:
         model = Ingredient
@@ -80,17 +107,35 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit_id'
+    )
+    amount = serializers.ReadOnlyField(source='total_amount')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class RecipeMiniSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_thumb = ImageThumbField()
+    image_srcset = ImageSrcsetField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id', 'name', 'image', 'image_thumb', 'image_srcset',
+            'cooking_time'
+        )
 
 
 class SubcriptionSerializer(UserGetSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -100,22 +145,20 @@ class SubcriptionSerializer(UserGetSerializer):
         )
 
     def get_recipes(self, user):
+        if hasattr(user, 'recipes_preview'):
+            return RecipeMiniSerializer(
+                user.recipes_preview, many=True, context=self.context
+            ).data
         request = self.context.get('request')
         queryset = Recipe.objects.filter(author=user)
         if request and not request.user.is_anonymous:
             recipes_limit = request.query_params.get('recipes_limit')
             if recipes_limit:
-                try:
-                    queryset = queryset[:int(recipes_limit)]
-                except TypeError:
-                    pass
+                queryset = queryset[:validate_recipes_limit(recipes_limit)]
         return RecipeMiniSerializer(
             queryset, many=True, context=self.context
         ).data
 
-    def get_recipes_count(self, user):
-        return Recipe.objects.filter(author=user).count()
-
 
 class SubscriptionCreateSerializer(serializers.ModelSerializer):
 
@@ -156,8 +199,27 @@ class SubscriptionCreateSerializer(serializers.ModelSerializer):
         ).data
 
 
+class BulkRelatedListSerializer(serializers.ListSerializer):
+    """
+    Список вложенных объектов, в котором поля BulkPrimaryKeyRelatedField
+    всех элементов получают объекты одним запросом на поле.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+        with ExitStack() as stack:
+            for field in self.child.fields.values():
+                if isinstance(field, BulkPrimaryKeyRelatedField):
+                    stack.enter_context(field.prefetch(
+                        item.get(field.field_name) for item in data
+                        if isinstance(item, Mapping)
+                    ))
+            return super().to_internal_value(data)
+
+
 class RecipeIngredientPostSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
     )
     amount = serializers.IntegerField(
@@ -169,13 +231,14 @@ class RecipeIngredientPostSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = BulkRelatedListSerializer
 
 
 class RecipeIngredientGetSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
-        source='ingredient.measurement_unit'
+        source='ingredient.measurement_unit_id'
     )
 
     class Meta:
@@ -191,42 +254,134 @@ class RecipeIngredientGetSerializer(serializers.ModelSerializer):
         return super().to_internal_value(data)
 
 
-class RecipeGetSerializer(serializers.ModelSerializer):
+class UserBasicSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Не зависящая от пользователя часть рецепта, которая кэшируется."""
 
     tags = TagSerializer(many=True)
-    author = UserGetSerializer(read_only=True)
+    author = UserBasicSerializer(read_only=True)
     ingredients = RecipeIngredientGetSerializer(
         many=True, required=True, source='ingredients_recipe'
     )
-    is_favorited = serializers.SerializerMethodField(read_only=True)
-    is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
     image = Base64ImageField()
+    image_thumb = ImageThumbField()
+    image_srcset = ImageSrcsetField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'name', 'text',
-            'cooking_time', 'image', 'is_favorited', 'is_in_shopping_cart'
+            'cooking_time', 'image', 'image_thumb', 'image_srcset'
         )
 
-    def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        return user.is_authenticated and user.favorite_user.filter(
-            recipe=obj.id
-        ).exists()
 
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        return user.is_authenticated and user.shopping_cart.filter(
-            recipe=obj.id
-        ).exists()
+def get_recipe_fragments(recipes):
+    """
+    Кэшированные фрагменты рецептов по их id.
+
+    Ключ фрагмента включает версии рецепта, его автора, тегов
+    и ингредиентов, поэтому любое их изменение делает фрагмент
+    устаревшим. Связанные данные загружаются только для промахов.
+    """
+    versions = get_versions({
+        'tags', 'ingredients',
+        *(f'recipe:{recipe.id}' for recipe in recipes),
+        *(f'user:{recipe.author_id}' for recipe in recipes),
+    })
+    keys = {
+        recipe.id: 'recipe-fragment:{}:{}:{}:{}:{}'.format(
+            recipe.id,
+            versions[f'recipe:{recipe.id}'],
+            versions[f'user:{recipe.author_id}'],
+            versions['tags'],
+            versions['ingredients'],
+        )
+        for recipe in recipes
+    }
+    fragments = cache.get_many(keys.values())
+    missed = [recipe for recipe in recipes if keys[recipe.id] not in fragments]
+    if missed:
+        prefetch_related_objects(missed, *RECIPE_FRAGMENT_PREFETCH)
+        rendered = {
+            keys[recipe.id]: RecipeFragmentSerializer(recipe).data
+            for recipe in missed
+        }
+        cache.set_many(rendered, RECIPE_FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(rendered)
+    return {recipe.id: fragments[keys[recipe.id]] for recipe in recipes}
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(
+            data.all() if isinstance(data, models.Manager) else data
+        )
+        fragments = get_recipe_fragments(recipes)
+        return [
+            self.child.merge_user_fields(recipe, fragments[recipe.id])
+            for recipe in recipes
+        ]
+
+
+class RecipeGetSerializer(RecipeFragmentSerializer):
+    """
+    Рецепт для чтения: кэшированный фрагмент и флаги пользователя.
+
+    Ожидает рецепты из recipe_read_queryset, где флаги уже
+    аннотированы.
+    """
+
+    author = UserGetSerializer(read_only=True)
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'tags', 'author', 'ingredients', 'name', 'text',
+            'cooking_time', 'image', 'image_thumb', 'image_srcset',
+            'is_favorited', 'is_in_shopping_cart'
+        )
+        list_serializer_class = RecipeListSerializer
+
+    def merge_user_fields(self, recipe, fragment):
+        build_absolute_uri = self.context['request'].build_absolute_uri
+        data = dict(fragment)
+        data['author'] = dict(
+            fragment['author'], is_subscribed=recipe.author_is_subscribed
+        )
+        for field in ('image', 'image_thumb'):
+            if data[field]:
+                data[field] = build_absolute_uri(data[field])
+        data['image_srcset'] = ', '.join(
+            '{} {}'.format(build_absolute_uri(url), width)
+            for url, width in (
+                item.split(' ') for item in data['image_srcset'].split(', ')
+                if item
+            )
+        )
+        data['is_favorited'] = recipe.is_favorited
+        data['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+        return data
+
+    def to_representation(self, instance):
+        return self.merge_user_fields(
+            instance, get_recipe_fragments([instance])[instance.id]
+        )
 
 
 class RecipePostSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientPostSerializer(
         many=True, required=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True, required=True
     )
     image = Base64ImageField()
@@ -243,27 +398,28 @@ class RecipePostSerializer(serializers.ModelSerializer):
             'name', 'text', 'cooking_time', 'image',
         )
 
-    def validate(self, data):
-        ingredients_data = data.get('ingredients')
+    def validate_ingredients(self, ingredients_data):
         if not ingredients_data:
             raise exceptions.ValidationError(
-                {'ingredients': 'Должен быть хотя бы один ингредиент.'}
+                'Должен быть хотя бы один ингредиент.'
             )
         ingredient_id = [ingredient['id'] for ingredient in ingredients_data]
         if len(ingredient_id) != len(set(ingredient_id)):
             raise exceptions.ValidationError(
-                {'ingredients': 'Ингредиенты не могут повторяться.'}
+                'Ингредиенты не могут повторяться.'
             )
-        tags_data = data.get('tags')
+        return ingredients_data
+
+    def validate_tags(self, tags_data):
         if not tags_data:
             raise exceptions.ValidationError(
-                {'tags': 'Должен быть хотя бы один тег.'}
+                'Должен быть хотя бы один тег.'
             )
         if len(tags_data) != len(set(tags_data)):
             raise exceptions.ValidationError(
-                {'tags': 'Теги не могут повторяться.'}
+                'Теги не могут повторяться.'
             )
-        return data
+        return tags_data
 
     def create_ingredients_amounts(self, ingredients_data, recipe):
         recipe_ingredients = []
@@ -277,6 +433,7 @@ class RecipePostSerializer(serializers.ModelSerializer):
             )
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
@@ -284,24 +441,79 @@ class RecipePostSerializer(serializers.ModelSerializer):
         recipe = super().create(validated_data)
         recipe.tags.set(tags_data)
         self.create_ingredients_amounts(ingredients_data, recipe)
+        pantry_changed((recipe.id,))
         return recipe
 
-    def update(self, instance, validated_data):
-        tags_data = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags_data)
-        ingredients_data = validated_data.pop('ingredients')
-        ingredients_recipe = instance.ingredients_recipe.all()
-        ingredients_recipe.delete()
-        self.create_ingredients_amounts(
-            recipe=instance, ingredients_data=ingredients_data
+    def update_shopping_lists(self, recipe, old_amounts, new_amounts):
+        """
+        Изменённые и добавленные строки состава в списках покупок.
+        Удалённые вычитает сигнал post_delete, а bulk_update
+        и bulk_create сигналов не шлют.
+        """
+        ShoppingListItem.objects.apply_amounts(
+            recipe.shopping_cart.values_list('user_id', flat=True),
+            {
+                ingredient_id: amount - old_amounts.get(ingredient_id, 0)
+                for ingredient_id, amount in new_amounts.items()
+            }
+        )
+
+    def update_ingredients_amounts(self, recipe, ingredients_data):
+        """
+        Приводит ингредиенты рецепта к переданным, меняя только
+        отличающиеся строки.
+        """
+        rows = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in rows.items()
+        }
+        new_amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        changed = []
+        for ingredient_id, row in rows.items():
+            amount = new_amounts.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in rows
         )
+        if old_amounts.keys() != new_amounts.keys():
+            Recipe.objects.filter(pk=recipe.pk).mark_similar_stale()
+            pantry_changed((recipe.id,))
+        self.update_shopping_lists(recipe, old_amounts, new_amounts)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        tags_data = validated_data.pop('tags', None)
+        if tags_data is not None:
+            instance.tags.set(tags_data)
+        ingredients_data = validated_data.pop('ingredients', None)
+        if ingredients_data is not None:
+            self.update_ingredients_amounts(instance, ingredients_data)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = recipe_read_queryset(request.user).get(pk=instance.pk)
         return RecipeGetSerializer(
             instance,
-            context={'request': self.context.get('request')}
+            context={'request': request}
         ).data
 
 
@@ -359,3 +571,44 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         return RecipeMiniSerializer(
             instance=instance.recipe,
         ).data
+
+
+class BulkRecipesSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=Length.MAX_BULK_RECIPES.value,
+    )
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=Length.MAX_PANTRY_INGREDIENTS.value,
+    )
+    tags = serializers.ListField(
+        child=serializers.SlugField(),
+        required=False,
+    )
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    format = serializers.CharField(required=False)
+
+    class Meta:
+        model = ExportJob
+        fields = (
+            'id', 'kind', 'format', 'status', 'file', 'error',
+            'created', 'finished'
+        )
+        read_only_fields = ('status', 'file', 'error', 'created', 'finished')
+
+    def validate(self, data):
+        formats = EXPORT_FORMATS[data['kind']]
+        data.setdefault('format', formats[0])
+        if data['format'] not in formats:
+            raise serializers.ValidationError({
+                'format': EXPORT_FORMAT_ERROR.format(', '.join(formats))
+            })
+        return data
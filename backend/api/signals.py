@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .indexes import pantry_changed
+from core.utils import bump_version
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+def bump_version_on_commit(name):
+    """Версия меняется после коммита, чтобы кэш не получил старые данные."""
+    transaction.on_commit(lambda: bump_version(name))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    bump_version_on_commit('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(**kwargs):
+    bump_version_on_commit('tags')
+
+
+@receiver(post_save, sender=Recipe)
+def bump_recipe_version(instance, **kwargs):
+    bump_version_on_commit(f'recipe:{instance.id}')
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def bump_recipe_ingredients_version(instance, **kwargs):
+    bump_version_on_commit(f'recipe:{instance.recipe_id}')
+    pantry_changed((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    pantry_changed(pk_set if reverse else (instance.id,))
+    if reverse:
+        bump_version_on_commit('tags')
+    else:
+        bump_version_on_commit(f'recipe:{instance.id}')
+
+
+@receiver(post_save, sender=User)
+def bump_user_version(instance, **kwargs):
+    bump_version_on_commit(f'user:{instance.id}')
+
+
+@receiver(post_save, sender=User)
+def bump_user_tokens_version(instance, created, **kwargs):
+    """Смена пароля или деактивация сбрасывает кэш аутентификации."""
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ):
+        bump_version_on_commit(f'token:{key}')
+
+
+@receiver(post_delete, sender=Token)
+def bump_token_version(instance, **kwargs):
+    bump_version_on_commit(f'token:{instance.key}')
@@ -2,8 +2,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    UsersViewSet, IngredientViewSet,
-    TagViewSet, RecipeViewSet, SubscriptionListView
+    UsersViewSet, ExportJobViewSet, IngredientViewSet, ReferenceView,
+    TagViewSet, RecipeViewSet, SubscriptionListView, TokenCacheView
 )
 
 app_name = 'api'
@@ -14,6 +14,7 @@ router_v1.register('users', UsersViewSet, basename='users')
 router_v1.register('ingredients', IngredientViewSet, basename='ingredients')
 router_v1.register('tags', TagViewSet, basename='tags')
 router_v1.register('recipes', RecipeViewSet, basename='recipes')
+router_v1.register('exports', ExportJobViewSet, basename='exports')
 
 urlpatterns = [
     path(
@@ -21,7 +22,11 @@ urlpatterns = [
         SubscriptionListView.as_view(),
         name='subscription-list'
     ),
+    path('reference/', ReferenceView.as_view(), name='reference'),
     path('', include(router_v1.urls)),
+    path(
+        'auth/token/cache/', TokenCacheView.as_view(), name='token-cache'
+    ),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
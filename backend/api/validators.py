@@ -2,6 +2,9 @@ from rest_framework import serializers
 
 
 VALIDATE_NAME_ERROR = 'Использовать имя "me" в качестве username запрещено.'
+VALIDATE_RECIPES_LIMIT_ERROR = (
+    'recipes_limit должен быть неотрицательным целым числом.'
+)
 
 
 def validate_username(value):
@@ -11,3 +14,16 @@ def validate_username(value):
             VALIDATE_NAME_ERROR
         )
     return value
+
+
+def validate_recipes_limit(value):
+    """Валидация параметра recipes_limit в запросах подписок."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = -1
+    if value < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': VALIDATE_RECIPES_LIMIT_ERROR}
+        )
+    return value
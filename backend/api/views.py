@@ -1,47 +1,81 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
 from djoser.views import UserViewSet
-from rest_framework import status
+from rest_framework import mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import (
-    IsAuthenticated, SAFE_METHODS, IsAuthenticatedOrReadOnly
+    IsAdminUser, IsAuthenticated, SAFE_METHODS, IsAuthenticatedOrReadOnly
 )
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import (
-    ReadOnlyModelViewSet, ModelViewSet
+    GenericViewSet, ReadOnlyModelViewSet, ModelViewSet
 )
-from .filters import IngredientFilter, RecipeFilter
-from .paginations import FoodgramPagination
+from .authentication import token_cache
+from .bulk import bulk_add, bulk_remove
+from .exports import enqueue_export
+from .filters import RecipeFilter, RecipeOrderingFilter
+from .indexes import ingredient_index, pantry_index, render_rows
+from .paginations import FoodgramPagination, KeysetPagination
 from .permissions import IsAuthorOrReadOnly
+from .querysets import (
+    recipe_read_queryset, shopping_list_rows, subscription_read_queryset,
+    user_read_queryset
+)
+from .reference import (
+    get_reference_content, get_tag_ids, reference_etag,
+    reference_last_modified
+)
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (
-    UserGetSerializer, UserCreatesSerializer,
-    FavoriteSerializer, IngredientSerializer,
+    UserGetSerializer, UserCreatesSerializer, BulkRecipesSerializer,
+    ExportJobSerializer, FavoriteSerializer, IngredientSerializer,
     TagSerializer, SubcriptionSerializer, ShoppingCartSerializer,
-    SubscriptionCreateSerializer,
-    RecipePostSerializer, RecipeGetSerializer
+    SubscriptionCreateSerializer, ShoppingListItemSerializer,
+    PantrySerializer, RecipeMiniSerializer, RecipePostSerializer,
+    RecipeGetSerializer
 )
+from .validators import validate_recipes_limit
 from core.utils import (
     create_list_of_shopping_cart, create_object, delete_object
 )
+from recipes.feed import feed_keys
 from recipes.models import (
-    Favorite, Ingredient, Recipe, Tag, ShoppingCart, RecipeIngredient
+    Favorite, Ingredient, Recipe, Tag, ShoppingCart
 )
 from users.models import User, Subscription
 
+PANTRY_TAGS_ERROR = 'Неизвестные теги: {}.'
+FEED_ORDERING = ('-pub_date', '-id')
+CURSOR_SEARCH_ERROR = 'Курсор нельзя совмещать с поиском, используйте page.'
+
 
 class UsersViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = UserGetSerializer
     pagination_class = FoodgramPagination
 
+    def get_queryset(self):
+        return user_read_queryset(self.request.user, super().get_queryset())
+
     def get_permissions(self):
         if self.action == 'me':
             return [IsAuthenticated()]
         return super().get_permissions()
 
+    def get_instance(self):
+        # request.user может быть из кэша токенов; меняем свежую копию.
+        if self.request.method in SAFE_METHODS:
+            return super().get_instance()
+        return get_object_or_404(User, pk=self.request.user.pk)
+
     @action(
         detail=True,
         methods=('POST', 'DELETE'),
@@ -50,7 +84,6 @@ class UsersViewSet(UserViewSet):
     def subscribe(self, request, **kwargs):
         author_id = self.kwargs.get('id')
         author = get_object_or_404(User, id=author_id)
-        author.save()
         user = request.user
         serializer = SubscriptionCreateSerializer(
             data={
@@ -89,46 +122,117 @@ class UsersViewSet(UserViewSet):
         new_password = serializer.validated_data['new_password']
         if self.request.user.check_password(current_password):
             self.request.user.set_password(new_password)
-            self.request.user.save()
+            # request.user может быть из кэша токенов, его счётчики
+            # устарели: сохраняем только пароль.
+            self.request.user.save(update_fields=['password'])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({'detail': 'Пароли не совпадают.'},
                         status=status.HTTP_400_BAD_REQUEST)
 
 
+class TokenCacheView(APIView):
+    """Счётчики кэша токенов процесса, обработавшего запрос."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(token_cache.stats())
+
+
 class SubscriptionListView(ListAPIView):
     serializer_class = SubcriptionSerializer
     pagination_class = FoodgramPagination
-    permission_classes = (IsAuthenticatedOrReadOnly,)
+    keyset_ordering = ('username', 'id')
+    permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
-        queryset = User.objects.filter(
-            subscription__user=self.request.user
-        )
-
-        return queryset
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is not None:
+            recipes_limit = validate_recipes_limit(recipes_limit)
+        return subscription_read_queryset(self.request.user, recipes_limit)
 
 
 class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    authentication_classes = ()
     pagination_class = None
 
+    @method_decorator(condition(
+        etag_func=reference_etag('ingredients'),
+        last_modified_func=reference_last_modified('ingredients'),
+    ))
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            content = render_rows(ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            ))
+        else:
+            content = get_reference_content('ingredients')
+        return HttpResponse(content, content_type='application/json')
+
 
 class TagViewSet(ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    authentication_classes = ()
     pagination_class = None
 
+    @method_decorator(condition(
+        etag_func=reference_etag('tags'),
+        last_modified_func=reference_last_modified('tags'),
+    ))
+    def list(self, request, *args, **kwargs):
+        return HttpResponse(
+            get_reference_content('tags'), content_type='application/json'
+        )
+
+
+class ReferenceView(APIView):
+    """Теги и ингредиенты одним запросом."""
+
+    authentication_classes = ()
+
+    @method_decorator(condition(
+        etag_func=reference_etag('tags', 'ingredients'),
+        last_modified_func=reference_last_modified('tags', 'ingredients'),
+    ))
+    def get(self, request):
+        return HttpResponse(
+            b'{"tags":' + get_reference_content('tags')
+            + b',"ingredients":' + get_reference_content('ingredients')
+            + b'}',
+            content_type='application/json'
+        )
+
 
 class RecipeViewSet(ModelViewSet):
-    queryset = Recipe.objects.select_related('author')
-    filter_backends = (DjangoFilterBackend,)
+    queryset = Recipe.objects.all()
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('favorites_count', 'pub_date')
+    ordering = ('-pub_date', '-id')
     permission_classes = IsAuthorOrReadOnly, IsAuthenticatedOrReadOnly
     pagination_class = FoodgramPagination
 
+    @property
+    def keyset_ordering(self):
+        if self.action == 'pantry':
+            return None
+        query_params = self.request.query_params
+        if (
+            'search' in query_params
+            and KeysetPagination.cursor_query_param in query_params
+        ):
+            # Порядок по релевантности не выражается полями рецепта,
+            # и курсор продолжил бы выдачу в другом порядке.
+            raise ValidationError({'cursor': CURSOR_SEARCH_ERROR})
+        return RecipeOrderingFilter().get_ordering(self.request, None, self)
+
+    def get_queryset(self):
+        return recipe_read_queryset(self.request.user, super().get_queryset())
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -157,17 +261,154 @@ class RecipeViewSet(ModelViewSet):
             return create_object(request, pk, FavoriteSerializer)
         return delete_object(Favorite, request, pk)
 
+    def bulk_change(self, request, model):
+        serializer = BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        change = bulk_add if request.method == 'POST' else bulk_remove
+        return Response(change(
+            model, request.user, serializer.validated_data['recipes']
+        ))
+
+    @action(
+        detail=False,
+        methods=('POST', 'DELETE'),
+        url_path='shopping_cart/bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_change(request, ShoppingCart)
+
     @action(
         detail=False,
+        methods=('POST', 'DELETE'),
+        url_path='favorite/bulk',
         permission_classes=(IsAuthenticated,)
     )
+    def favorite_bulk(self, request):
+        return self.bulk_change(request, Favorite)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Похожие по ингредиентам рецепты из build_similar_recipes."""
+        recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        return Response(RecipeMiniSerializer(
+            Recipe.objects.filter(similar_to__recipe=recipe).order_by(
+                '-similar_to__score', '-id'
+            ),
+            many=True,
+            context={'request': request}
+        ).data)
+
+    @action(detail=False)
+    def pantry(self, request):
+        """
+        Рецепты по доле своих ингредиентов, которые есть у пользователя:
+        ?ingredients=<id>&ingredients=<id>[&tags=<slug>].
+        """
+        params = PantrySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        tag_ids = None
+        if params.validated_data.get('tags'):
+            known_tags = get_tag_ids()
+            unknown = set(params.validated_data['tags']) - known_tags.keys()
+            if unknown:
+                raise ValidationError({'tags': PANTRY_TAGS_ERROR.format(
+                    ', '.join(sorted(unknown))
+                )})
+            tag_ids = [
+                known_tags[slug] for slug in params.validated_data['tags']
+            ]
+        page = self.paginate_queryset(pantry_index.search(
+            params.validated_data['ingredients'], tag_ids
+        ))
+        recipes = recipe_read_queryset(request.user).in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        rows = [row for row in page if row[0] in recipes]
+        data = RecipeGetSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in rows],
+            many=True,
+            context=self.get_serializer_context()
+        ).data
+        for recipe, (_, matched, total) in zip(data, rows):
+            recipe['coverage'] = round(matched / total, 4)
+            recipe['missing'] = total - matched
+        return self.get_paginated_response(data)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """
+        Рецепты авторов, на которых подписан пользователь, от новых
+        к старым. Страницы только по курсору: без COUNT и фильтров,
+        чтобы читать ленту по индексу.
+        """
+        paginator = KeysetPagination(
+            FEED_ORDERING, self.paginator.get_page_size(request)
+        )
+
+        def fetch(values, reverse, limit):
+            keys = feed_keys(request.user, values, reverse, limit)
+            recipes = self.get_queryset().in_bulk(
+                [recipe_id for _, recipe_id in keys]
+            )
+            return [
+                recipes[recipe_id] for _, recipe_id in keys
+                if recipe_id in recipes
+            ]
+
+        page = paginator.paginate(Recipe, fetch, request)
+        return paginator.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=SHOPPING_LIST_RENDERERS
+    )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            total_qty=Sum('amount')
+        return create_list_of_shopping_cart(
+            shopping_list_rows(request.user).iterator(),
+            request.accepted_renderer
         )
 
-        return create_list_of_shopping_cart(ingredients)
+    @action(
+        detail=False,
+        url_path='shopping_cart/totals',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_totals(self, request):
+        serializer = ShoppingListItemSerializer(
+            request.user.shopping_list.select_related('ingredient').order_by(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ),
+            many=True
+        )
+        return Response(serializer.data)
+
+
+class ExportJobViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    GenericViewSet
+):
+    """Выгрузки пользователя, которые собирает run_export_worker."""
+
+    serializer_class = ExportJobSerializer
+    pagination_class = FoodgramPagination
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return self.request.user.export_jobs.all()
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job, created = enqueue_export(
+            request.user, **serializer.validated_data
+        )
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+SHARED_VERSIONS_BACKENDS = (
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django.core.cache.backends.memcached.MemcachedCache',
+    'django_redis.cache.RedisCache',
+)
+LOCAL_VERSIONS_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches)
+def check_versions_cache(app_configs, **kwargs):
+    """
+    Версии и журналы изменений должны быть общими для процессов,
+    с атомарными add и incr и без вытеснения по числу записей.
+    """
+    backend = settings.CACHES.get('versions', {}).get('BACKEND')
+    if backend in SHARED_VERSIONS_BACKENDS:
+        return []
+    if backend == LOCAL_VERSIONS_BACKEND:
+        return [Warning(
+            'Кэш versions хранится в памяти процесса.',
+            hint=(
+                'Годится только для одного процесса (разработка, '
+                'тесты). Для gunicorn с несколькими воркерами нужен '
+                'memcached или Redis.'
+            ),
+            id='core.W001',
+        )]
+    return [Error(
+        f'Кэш versions не поддерживается: {backend}.',
+        hint=(
+            'Нужен memcached (PyMemcacheCache, запуск с -M) или Redis: '
+            'файловый кэш и кэш в базе не атомарны и удаляют случайные '
+            'ключи при переполнении.'
+        ),
+        id='core.E001',
+    )]
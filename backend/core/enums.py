@@ -17,3 +17,7 @@ class Length(IntEnum):
     MAX_LENGTH_ROLE = 150
     MAX_LENGTH_PASSWORD = 150
     MAX_LENGHT_COLOR_FIELD = 7
+    MAX_LENGTH_EXPORT_FIELD = 20
+    MAX_LENGTH_FINGERPRINT = 64
+    MAX_BULK_RECIPES = 100
+    MAX_PANTRY_INGREDIENTS = 100
@@ -0,0 +1,25 @@
+class BackgroundFieldsMixin:
+    """
+    Поля, которые меняют только сигналы и фоновые задачи.
+
+    Обычный save() загруженного объекта их не записывает, иначе он
+    вернул бы в базу значения на момент загрузки. Записать такие поля
+    можно явным update_fields или через QuerySet.update().
+    """
+
+    background_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.background_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
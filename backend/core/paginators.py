@@ -0,0 +1,41 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def estimate_count(queryset):
+    """Число строк запроса по оценке планировщика PostgreSQL."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator, который не считает COUNT(*) по большим выборкам.
+
+    На PostgreSQL число строк берётся из плана запроса, точный
+    подсчёт выполняется, только если оценка меньше
+    ESTIMATED_COUNT_THRESHOLD.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if (
+            isinstance(queryset, QuerySet)
+            and connections[queryset.db].vendor == 'postgresql'
+        ):
+            estimate = estimate_count(queryset)
+            if estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
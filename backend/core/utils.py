@@ -1,4 +1,10 @@
-from django.http import FileResponse
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
 from rest_framework import status
@@ -6,6 +12,10 @@ from rest_framework import status
 from recipes.models import Recipe
 
 
+CHANGES_TIMEOUT = 24 * 60 * 60
+CHANGES_LIMIT = 1000
+CHANGES_ATTEMPTS = 3
+
 RESPONSE_RECIPE_POST_ERROR_MESSAGE = 'Ошибка. Рецепт уже был добавлен.'
 RESPONSE_RECIPE_DELETE_ERROR_MESSAGE = 'Ошибка. Рецепт уже был удалён.'
 RESPONSE_NOT_AUTHENTICATED_ERROR_MESSAGE = '''
@@ -28,7 +38,8 @@ def create_object(request, pk, model_serializer):
         context={'request': request}
     )
     serializer.is_valid(raise_exception=True)
-    serializer.save()
+    with transaction.atomic():
+        serializer.save()
     return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -48,16 +59,116 @@ def delete_object(model, request, pk):
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-def create_list_of_shopping_cart(ingredients):
-    shopping_list = []
-    for ingredient in ingredients:
-        name = ingredient['ingredient__name']
-        amount = ingredient['ingredient__measurement_unit']
-        measurement_unit = ingredient['total_qty']
-        shopping_list.append(f'{name}: {amount} {measurement_unit}')
-    content = '\n'.join(shopping_list)
-    response = FileResponse(content, content_type='text/plain')
+def create_list_of_shopping_cart(ingredients, renderer):
+    response = StreamingHttpResponse(
+        renderer.stream(ingredients),
+        content_type=(
+            f'{renderer.media_type}; charset={renderer.charset}'
+            if renderer.charset else renderer.media_type
+        )
+    )
     response['Content-Disposition'] = (
-        'attachment; filename="shopping_cart.txt"'
+        f'attachment; filename="{renderer.filename}"'
     )
     return response
+
+
+def versions_cache():
+    """
+    Кэш версий: отдельно от кэша фрагментов, чтобы вытеснение
+    фрагментов не задевало версии.
+    """
+    return caches['versions']
+
+
+def get_versions(names):
+    """
+    Версии наборов данных names в кэше версий.
+
+    Версия - время последнего изменения в микросекундах, поэтому
+    из неё же получается заголовок Last-Modified.
+    """
+    cache = versions_cache()
+    keys = {f'version:{name}': name for name in names}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns() // 1000
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def get_version(name):
+    return get_versions((name,))[name]
+
+
+def peek_version(name):
+    """Версия name или None, если её ещё нет; ничего не создаёт."""
+    return versions_cache().get(f'version:{name}')
+
+
+def bump_version(name):
+    versions_cache().set(
+        f'version:{name}',
+        max(time.time_ns() // 1000, get_version(name) + 1),
+        timeout=None
+    )
+
+
+def log_changes(name, ids):
+    """
+    Добавляет в журнал изменений name id изменённых объектов
+    (None - изменилось неизвестно что) и возвращает номер записи.
+
+    Номер выдаёт атомарный incr кэша версий, запись кладётся
+    атомарным add, поэтому писатели не затирают записи друг друга.
+    Номера идут подряд от времени в микросекундах, как у версий:
+    вытесненный счётчик начнётся заново далеко впереди, и читатели
+    журнала это заметят. Если записать не удалось за
+    CHANGES_ATTEMPTS попыток, счётчик удаляется - читатели тогда
+    перестраивают данные целиком - и возвращается None.
+    """
+    cache = versions_cache()
+    key = f'changes:{name}'
+    value = None if ids is None else sorted(ids)
+    for _ in range(CHANGES_ATTEMPTS):
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        try:
+            number = cache.incr(key)
+        except ValueError:
+            continue
+        if cache.add(f'{key}:{number}', value, timeout=CHANGES_TIMEOUT):
+            return number
+    cache.delete(key)
+    return None
+
+
+def get_changes(name, since):
+    """
+    Номер последней записи журнала name и множество id из записей
+    после since.
+
+    Вместо множества возвращается None, если since неизвестен,
+    счётчик начат заново, записей больше CHANGES_LIMIT, какой-то
+    из них нет в кэше или в какой-то изменилось неизвестно что.
+    """
+    cache = versions_cache()
+    key = f'changes:{name}'
+    cache.add(key, time.time_ns() // 1000, timeout=None)
+    last = cache.get(key)
+    if since is None or last is None or not (
+        since <= last <= since + CHANGES_LIMIT
+    ):
+        return last, None
+    keys = [f'{key}:{number}' for number in range(since + 1, last + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) < len(keys) or None in entries.values():
+        return last, None
+    return last, set().union(*entries.values())
+
+
+def change_counter(queryset, field, delta):
+    """Атомарно меняет счётчик field на delta, не опуская его ниже нуля."""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
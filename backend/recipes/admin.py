@@ -1,42 +1,79 @@
 from django.contrib import admin
 
 from .models import (
-    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+    ExportJob, Favorite, Ingredient, MeasurementUnit, Recipe,
+    RecipeIngredient, ShoppingCart, Tag
 )
+from core.paginators import EstimatedCountPaginator
+
+
+class EstimatedCountAdmin(admin.ModelAdmin):
+    """Список без точного COUNT(*) по всей таблице."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 1
     min_num = 1
+    autocomplete_fields = ('ingredient',)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(EstimatedCountAdmin):
+    list_display = ('id', 'user', 'kind', 'format', 'status', 'created')
+    list_filter = ('status', 'kind')
+    list_select_related = ('user',)
+    readonly_fields = ('fingerprint', 'created', 'started', 'finished')
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(EstimatedCountAdmin):
     list_display = ('id', 'user', 'recipe',)
-    search_fields = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(EstimatedCountAdmin):
     list_display = ('id', 'name', 'measurement_unit')
     list_filter = ('measurement_unit',)
+    list_select_related = ('measurement_unit',)
+    search_fields = ('name',)
+
+
+@admin.register(MeasurementUnit)
+class MeasurementUnitAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'base', 'factor')
+    list_filter = ('base',)
     search_fields = ('name',)
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(EstimatedCountAdmin):
     inlines = (RecipeIngredientInline,)
-    list_display = ('id', 'name', 'author', 'text', 'image')
+    list_display = (
+        'id', 'name', 'author', 'text', 'image', 'favorites_count'
+    )
     list_display_links = ('name',)
-    search_fields = ('name', 'author', 'text', 'ingredients')
+    list_select_related = ('author',)
+    search_fields = (
+        'name', 'author__username', 'ingredients_recipe__ingredient__name'
+    )
     list_filter = ('tags',)
+    autocomplete_fields = ('author',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(EstimatedCountAdmin):
     list_display = ('id', 'user', 'recipe',)
-    search_fields = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(Tag)
@@ -0,0 +1,98 @@
+import heapq
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import FeedItem, Recipe
+from users.models import Subscription
+
+FEED_BATCH_SIZE = 1000
+
+
+def fan_out(recipe):
+    """
+    Раскладывает новый рецепт по лентам подписчиков автора.
+
+    Рецепты авторов, у которых подписчиков больше FEED_FANOUT_LIMIT,
+    не раскладываются: их подмешивает feed_recipes при чтении.
+    """
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True)[:limit + 1])
+    if len(followers) > limit:
+        return False
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+            for user_id in followers
+        ),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    Recipe.objects.filter(pk=recipe.pk).update(fanned_out=True)
+    return True
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту нового подписчика разосланные рецепты автора."""
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author_id=author_id, fanned_out=True
+            ).order_by().values_list('id', 'pub_date').iterator()
+        ),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def keyset_condition(date_field, id_field, key, reverse):
+    """(date_field, id_field) строго после key в порядке ленты."""
+    lookup = 'gt' if reverse else 'lt'
+    date, recipe_id = key
+    return Q(**{f'{date_field}__{lookup}': date}) | Q(
+        **{date_field: date, f'{id_field}__{lookup}': recipe_id}
+    )
+
+
+def feed_keys(user, after, reverse, limit):
+    """
+    Ключи (pub_date, id) не больше limit рецептов ленты user строго
+    после after: от новых к старым, с reverse - от старых к новым.
+
+    Разосланные рецепты читаются только из индекса FeedItem
+    (user, -pub_date, -recipe), без таблицы рецептов. Неразосланные
+    рецепты популярных авторов выбираются отдельным запросом по
+    частичному индексу, и два упорядоченных списка сливаются.
+    """
+    timeline = FeedItem.objects.filter(user=user)
+    merged = Recipe.objects.filter(
+        fanned_out=False,
+        author__in=Subscription.objects.filter(user=user).values('author'),
+    )
+    if after is not None:
+        timeline = timeline.filter(
+            keyset_condition('pub_date', 'recipe_id', after, reverse)
+        )
+        merged = merged.filter(
+            keyset_condition('pub_date', 'id', after, reverse)
+        )
+    sign = '' if reverse else '-'
+    keys = heapq.merge(
+        timeline.order_by(
+            f'{sign}pub_date', f'{sign}recipe_id'
+        ).values_list('pub_date', 'recipe_id')[:limit],
+        merged.order_by(
+            f'{sign}pub_date', f'{sign}id'
+        ).values_list('pub_date', 'id')[:limit],
+        reverse=not reverse,
+    )
+    return list(dict.fromkeys(keys))[:limit]
@@ -0,0 +1,113 @@
+from .models import SEARCH_FTS_TABLE
+
+SQLITE_FOLD = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+SQLITE_INGREDIENTS = """(
+    SELECT coalesce(group_concat({}, ' '), '')
+    FROM recipes_recipeingredient ri
+    JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+    WHERE ri.recipe_id = {{}}
+)""".format(SQLITE_FOLD.format('i.name'))
+
+SQLITE_TRIGGERS = {
+    'recipes_recipe_fts_insert': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert
+    AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text)
+        VALUES (NEW.id, {}, {}, {});
+    END
+    """.format(
+        SQLITE_FOLD.format('NEW.name'), SQLITE_INGREDIENTS.format('NEW.id'),
+        SQLITE_FOLD.format('NEW.text')
+    ),
+    'recipes_recipe_fts_update': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        UPDATE recipes_recipe_fts SET name = {}, text = {}
+        WHERE rowid = NEW.id;
+    END
+    """.format(
+        SQLITE_FOLD.format('NEW.name'), SQLITE_FOLD.format('NEW.text')
+    ),
+    'recipes_recipe_fts_delete': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete
+    AFTER DELETE ON recipes_recipe
+    BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = OLD.id;
+    END
+    """,
+    'recipes_recipeingredient_fts_insert': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipeingredient_fts_insert
+    AFTER INSERT ON recipes_recipeingredient
+    BEGIN
+        UPDATE recipes_recipe_fts SET ingredients = {}
+        WHERE rowid = NEW.recipe_id;
+    END
+    """.format(SQLITE_INGREDIENTS.format('NEW.recipe_id')),
+    'recipes_recipeingredient_fts_update': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipeingredient_fts_update
+    AFTER UPDATE ON recipes_recipeingredient
+    BEGIN
+        UPDATE recipes_recipe_fts SET ingredients = {}
+        WHERE rowid IN (OLD.recipe_id, NEW.recipe_id);
+    END
+    """.format(SQLITE_INGREDIENTS.format('recipes_recipe_fts.rowid')),
+    'recipes_recipeingredient_fts_delete': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipeingredient_fts_delete
+    AFTER DELETE ON recipes_recipeingredient
+    BEGIN
+        UPDATE recipes_recipe_fts SET ingredients = {}
+        WHERE rowid = OLD.recipe_id;
+    END
+    """.format(SQLITE_INGREDIENTS.format('OLD.recipe_id')),
+    'recipes_ingredient_fts_update': """
+    CREATE TRIGGER IF NOT EXISTS recipes_ingredient_fts_update
+    AFTER UPDATE OF name ON recipes_ingredient
+    BEGIN
+        UPDATE recipes_recipe_fts SET ingredients = {}
+        WHERE rowid IN (
+            SELECT recipe_id FROM recipes_recipeingredient
+            WHERE ingredient_id = NEW.id
+        );
+    END
+    """.format(SQLITE_INGREDIENTS.format('recipes_recipe_fts.rowid')),
+}
+
+SQLITE_REBUILD = [
+    f'DELETE FROM {SEARCH_FTS_TABLE}',
+    f"""
+    INSERT INTO {SEARCH_FTS_TABLE} (rowid, name, ingredients, text)
+    SELECT r.id, {SQLITE_FOLD.format('r.name')},
+        {SQLITE_INGREDIENTS.format('r.id')}, {SQLITE_FOLD.format('r.text')}
+    FROM recipes_recipe r
+    """,
+]
+
+
+def ensure_sqlite_search_index(connection):
+    """
+    Восстанавливает триггеры FTS5 в SQLite.
+
+    SQLite пересоздаёт таблицу при AddField и AlterField, и триггеры
+    из миграции 0003 пропадают вместе со старой таблицей. Это
+    единственное место, где триггеры создаются заново: миграции
+    только удаляют те, что мешают пересозданию таблиц. Если
+    какого-то триггера не хватало, индекс перестраивается целиком.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE type IN ('table', 'trigger')"
+        )
+        existing = {name for _, name in cursor.fetchall()}
+        if SEARCH_FTS_TABLE not in existing:
+            return False
+        missing = set(SQLITE_TRIGGERS) - existing
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        if missing:
+            for sql in SQLITE_REBUILD:
+                cursor.execute(sql)
+    return bool(missing)
@@ -0,0 +1,115 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from core.utils import bump_version
+
+THUMBNAIL_SIZE = (320, 320)
+SRCSET_WIDTHS = (480, 960, 1440)
+WEBP_QUALITY = 80
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANT_WORKERS,
+    thread_name_prefix='image-variants',
+)
+
+
+def variant_name(name, suffix):
+    directory, filename = os.path.split(os.path.splitext(name)[0])
+    return os.path.join(directory, 'variants', f'{filename}_{suffix}.webp')
+
+
+def save_webp(image, name):
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def needs_variants(recipe):
+    return bool(recipe.image) and (
+        (recipe.image_variants or {}).get('source') != recipe.image.name
+    )
+
+
+def generate_variants(recipe_id, force=False):
+    """
+    Создаёт миниатюру и WebP-варианты изображения рецепта.
+
+    Варианты записываются, только если изображение не сменилось
+    за время обработки. Возвращает True, если они обновлены.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'image_variants'
+    ).first()
+    if recipe is None or not recipe.image or not (
+        force or needs_variants(recipe)
+    ):
+        return False
+    source = recipe.image.name
+    with default_storage.open(source) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert(
+            'RGBA' if 'A' in image.getbands()
+            or 'transparency' in image.info else 'RGB'
+        )
+    variants = {
+        'source': source,
+        'thumb': save_webp(
+            ImageOps.fit(image, THUMBNAIL_SIZE),
+            variant_name(source, 'thumb')
+        ),
+        'srcset': [],
+    }
+    for width in SRCSET_WIDTHS:
+        if width > image.width and variants['srcset']:
+            break
+        width = min(width, image.width)
+        height = max(1, round(image.height * width / image.width))
+        variants['srcset'].append((
+            save_webp(
+                image.resize((width, height), Image.LANCZOS),
+                variant_name(source, f'{width}w')
+            ),
+            width
+        ))
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_variants=variants
+    )
+    if updated:
+        bump_version(f'recipe:{recipe_id}')
+    delete_variants(recipe.image_variants if updated else variants)
+    return bool(updated)
+
+
+def delete_variants(variants):
+    if not variants:
+        return
+    names = [variants.get('thumb')] + [
+        name for name, _ in variants.get('srcset', ())
+    ]
+    for name in names:
+        if name:
+            default_storage.delete(name)
+
+
+def generate_variants_in_background(recipe_id):
+    def task():
+        try:
+            generate_variants(recipe_id)
+        except Exception:
+            logger.exception(
+                'Не удалось создать варианты изображения рецепта %s',
+                recipe_id
+            )
+        finally:
+            connection.close()
+    executor.submit(task)
@@ -0,0 +1,121 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe, SimilarRecipe
+from recipes.similar import SimilarityIndex, load_vectors, top
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие по ингредиентам рецепты для рецептов, '
+        'изменённых с прошлого запуска, и для их соседей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все рецепты.',
+        )
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=settings.SIMILAR_RECIPES_COUNT,
+            help='Сколько похожих рецептов хранить для каждого.',
+        )
+        parser.add_argument(
+            '--max-df',
+            type=float,
+            default=0.05,
+            help=(
+                'Ингредиенты из большей доли рецептов не используются '
+                'для поиска кандидатов.'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько рецептов записывать в одной транзакции.',
+        )
+
+    def affected_recipes(self, index, touched, count):
+        """
+        Рецепты, чей список мог измениться: изменённые, те, у кого они
+        были в списке, и те, в чей список они теперь попадают.
+        """
+        current = defaultdict(list)
+        for recipe_id, similar_id, score in SimilarRecipe.objects.order_by(
+        ).values_list('recipe_id', 'similar_id', 'score').iterator():
+            current[recipe_id].append((score, similar_id))
+        affected = set(touched)
+        for recipe_id, rows in current.items():
+            if any(similar_id in touched for _, similar_id in rows):
+                affected.add(recipe_id)
+        threshold = {
+            recipe_id: min(rows)[0] for recipe_id, rows in current.items()
+            if len(rows) >= count
+        }
+        for recipe_id in touched:
+            for candidate, score in index.scores(recipe_id).items():
+                if score >= threshold.get(candidate, 0):
+                    affected.add(candidate)
+        return affected
+
+    def clear_stale(self, versions, recipe_ids):
+        """Снимает флаг с рецептов, чья версия равна прочитанной."""
+        by_version = defaultdict(list)
+        for recipe_id in recipe_ids:
+            by_version[versions[recipe_id]].append(recipe_id)
+        for version, ids in by_version.items():
+            Recipe.objects.filter(
+                pk__in=ids, similar_version=version
+            ).update(similar_stale=False)
+
+    def handle(self, *args, **options):
+        stale = Recipe.objects.all()
+        if not options['full']:
+            stale = stale.filter(similar_stale=True)
+        # Версии читаются до загрузки векторов: флаг снимается только
+        # там, где рецепт не меняли, пока шёл пересчёт.
+        versions = dict(stale.values_list('id', 'similar_version'))
+        touched = set(versions)
+        if not touched:
+            self.stdout.write(self.style.SUCCESS('Изменённых рецептов нет.'))
+            return
+        vectors = load_vectors()
+        index = SimilarityIndex(vectors, options['max_df'])
+        count = options['count']
+        affected = touched if options['full'] else self.affected_recipes(
+            index, touched, count
+        )
+        # У рецептов без ингредиентов похожих нет: старые списки
+        # удаляются вместе со снятием флага.
+        empty = affected - vectors.keys()
+        affected = sorted(affected & vectors.keys())
+        batch_size = options['batch_size']
+        for start in range(0, len(affected), batch_size):
+            batch = affected[start:start + batch_size]
+            with transaction.atomic():
+                SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+                SimilarRecipe.objects.bulk_create(
+                    SimilarRecipe(
+                        recipe_id=recipe_id, similar_id=similar_id,
+                        score=score
+                    )
+                    for recipe_id in batch
+                    for similar_id, score in top(
+                        index.scores(recipe_id), count
+                    )
+                )
+                self.clear_stale(versions, touched.intersection(batch))
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=empty).delete()
+            self.clear_stale(versions, touched & empty)
+        self.stdout.write(self.style.SUCCESS(
+            f'Изменённых рецептов: {len(touched)}, '
+            f'пересчитано списков: {len(affected)}.'
+        ))
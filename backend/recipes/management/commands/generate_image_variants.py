@@ -0,0 +1,69 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management import BaseCommand
+from django.db import connections
+from tqdm import tqdm
+
+from recipes.images import generate_variants, needs_variants
+from recipes.models import Recipe
+
+
+def generate(recipe_id, force):
+    try:
+        return recipe_id, generate_variants(recipe_id, force), None
+    except Exception as error:
+        return recipe_id, False, str(error)
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт миниатюры и WebP-варианты для уже загруженных '
+        'изображений рецептов в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов, по умолчанию по числу ядер.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать варианты для всех рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipe_ids = [
+            recipe.id for recipe in Recipe.objects.only(
+                'image', 'image_variants'
+            ).order_by().iterator()
+            if recipe.image and (options['force'] or needs_variants(recipe))
+        ]
+        connections.close_all()
+        generated, failed = 0, 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=django.setup
+        ) as executor:
+            futures = [
+                executor.submit(generate, recipe_id, options['force'])
+                for recipe_id in recipe_ids
+            ]
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                recipe_id, updated, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                elif updated:
+                    generated += 1
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {generated}, ошибок: {failed}, '
+            f'пропущено: {len(recipe_ids) - generated - failed}, '
+            f'за {elapsed:.2f} с.'
+        ))
@@ -1,23 +1,167 @@
 import csv
+import io
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 from tqdm import tqdm
 
+from core.enums import Length
+from core.utils import bump_version
 from recipes.models import (
     Ingredient
 )
+from recipes.units import create_units
+
+DEFAULT_PATH = Path(__file__).resolve().parents[2] / 'data' / 'ingredients.csv'
+MAX_REPORTED_CONFLICTS = 20
 
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV (название, единицы измерения) '
+        'или JSON (список объектов name, measurement_unit). '
+        'Новые единицы измерения добавляются в справочник.'
+    )
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(DEFAULT_PATH),
+            help='Путь к файлу, по умолчанию recipes/data/ingredients.csv.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла, по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для bulk_create.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет добавлено.',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загрузка через COPY (только PostgreSQL).',
+        )
+
+    def read_rows(self, path, file_format):
+        with open(path, 'r', encoding='utf-8') as file:
+            if file_format == 'json':
+                for item in json.load(file):
+                    yield item.get('name'), item.get('measurement_unit')
+            else:
+                for row in csv.reader(file):
+                    yield tuple(row) if len(row) == 2 else (None, None)
+
+    def parse_rows(self, path, file_format):
+        rows, invalid = {}, 0
+        for name, measurement_unit in self.read_rows(path, file_format):
+            name = (name or '').strip()
+            measurement_unit = (measurement_unit or '').strip()
+            if (
+                not name or not measurement_unit
+                or len(name) > Length.MAX_LEN_RECIPES_CHARFIELD.value
+                or len(measurement_unit)
+                > Length.MAX_LEN_MEASUREMENT_UNIT.value
+            ):
+                invalid += 1
+                continue
+            rows[(name, measurement_unit)] = None
+        return list(rows), invalid
 
-        with open(
-            'recipes/data/ingredients.csv', 'r', encoding='utf-8'
-        ) as csvfile:
-            reader = csv.reader(csvfile)
-            for row in tqdm(reader):
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
+    def bulk_insert(self, rows, batch_size):
+        for start in tqdm(range(0, len(rows), batch_size)):
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit_id=measurement_unit)
+                    for name, measurement_unit
+                    in rows[start:start + batch_size]
+                ],
+                ignore_conflicts=True,
+            )
+
+    def copy_insert(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT ON CONSTRAINT unique_ingredient DO NOTHING'
+            )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f'Файл {path} не найден.')
+        file_format = options['format'] or (
+            'json' if path.suffix.lower() == '.json' else 'csv'
+        )
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('COPY доступен только для PostgreSQL.')
+        started = time.monotonic()
+        rows, invalid = self.parse_rows(path, file_format)
+        known_units = defaultdict(set)
+        for name, measurement_unit in Ingredient.objects.values_list(
+            'name', 'measurement_unit'
+        ):
+            known_units[name].add(measurement_unit)
+        new_rows, conflicts, unchanged = [], [], 0
+        for name, measurement_unit in rows:
+            if measurement_unit in known_units[name]:
+                unchanged += 1
+                continue
+            if known_units[name]:
+                conflicts.append(
+                    (name, measurement_unit, sorted(known_units[name]))
                 )
+            known_units[name].add(measurement_unit)
+            new_rows.append((name, measurement_unit))
+        for name, measurement_unit, units in conflicts[
+            :MAX_REPORTED_CONFLICTS
+        ]:
+            self.stdout.write(self.style.WARNING(
+                f'{name}: {measurement_unit} '
+                f'(уже есть: {", ".join(units)})'
+            ))
+        self.stdout.write(
+            f'Новых: {len(new_rows) - len(conflicts)}, '
+            f'с другими единицами измерения: {len(conflicts)}, '
+            f'без изменений: {unchanged}, некорректных строк: {invalid}.'
+        )
+        if options['dry_run'] or not new_rows:
+            return
+        create_units({measurement_unit for _, measurement_unit in new_rows})
+        if options['copy']:
+            self.copy_insert(new_rows)
+        else:
+            self.bulk_insert(new_rows, options['batch_size'])
+        bump_version('ingredients')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено {len(new_rows)} из {len(rows)} строк '
+            f'за {elapsed:.2f} с ({len(rows) / elapsed:.0f} строк/с).'
+        ))
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from recipes.feed import FEED_BATCH_SIZE
+from recipes.models import FeedItem, Recipe
+from users.models import Subscription
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок: раскладывает рецепты авторов, '
+        'у которых подписчиков не больше FEED_FANOUT_LIMIT.'
+    )
+
+    def handle(self, *args, **options):
+        popular = Subscription.objects.order_by().values('author').annotate(
+            followers=Count('id')
+        ).filter(followers__gt=settings.FEED_FANOUT_LIMIT).values('author')
+        with transaction.atomic():
+            FeedItem.objects.all().delete()
+            Recipe.objects.filter(author__in=popular).update(fanned_out=False)
+            Recipe.objects.exclude(author__in=popular).update(fanned_out=True)
+            created = len(FeedItem.objects.bulk_create(
+                (
+                    FeedItem(
+                        user_id=user_id, recipe_id=recipe_id,
+                        pub_date=pub_date
+                    )
+                    for user_id, recipe_id, pub_date in (
+                        Subscription.objects.filter(
+                            author__recipes__fanned_out=True
+                        ).order_by().values_list(
+                            'user_id', 'author__recipes__id',
+                            'author__recipes__pub_date'
+                        ).iterator()
+                    )
+                ),
+                batch_size=FEED_BATCH_SIZE,
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {created}.'
+        ))
@@ -0,0 +1,69 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает списки покупок по корзинам пользователей '
+        'и сообщает о расхождениях.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправляя.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = {
+                (row['recipe__shopping_cart__user'], row['ingredient']):
+                    row['total']
+                for row in RecipeIngredient.objects.filter(
+                    recipe__shopping_cart__isnull=False
+                ).values(
+                    'recipe__shopping_cart__user', 'ingredient'
+                ).annotate(
+                    total=Sum('amount')
+                ).order_by().iterator()
+            }
+            to_update, to_delete = [], []
+            for item in ShoppingListItem.objects.select_for_update(
+            ).order_by().iterator():
+                total = expected.pop((item.user_id, item.ingredient_id), None)
+                if total is None:
+                    to_delete.append(item.id)
+                elif total != item.total_amount:
+                    item.total_amount = total
+                    to_update.append(item)
+            to_create = [
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total,
+                )
+                for (user_id, ingredient_id), total in expected.items()
+            ]
+            if not options['dry_run']:
+                ShoppingListItem.objects.bulk_create(to_create)
+                ShoppingListItem.objects.bulk_update(
+                    to_update, ('total_amount',)
+                )
+                ShoppingListItem.objects.filter(id__in=to_delete).delete()
+        self.stdout.write(
+            f'Отсутствовало строк: {len(to_create)}, '
+            f'с неверным количеством: {len(to_update)}, '
+            f'лишних: {len(to_delete)}.'
+        )
+        if to_create or to_update or to_delete:
+            self.stdout.write(self.style.WARNING(
+                'Найдены расхождения' + (
+                    '.' if options['dry_run'] else ', списки исправлены.'
+                )
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
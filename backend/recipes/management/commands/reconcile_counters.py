@@ -0,0 +1,63 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def actual_count(related_model, field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счётчики избранного, корзин, '
+        'рецептов и подписчиков с данными и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправляя.',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, counter, related_model, field in COUNTERS:
+            actual = actual_count(related_model, field)
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{counter: actual}
+            )
+            if options['dry_run']:
+                fixed = drifted.count()
+            else:
+                fixed = model.objects.filter(
+                    pk__in=drifted.values('pk')
+                ).update(**{counter: actual})
+            total += fixed
+            self.stdout.write(
+                f'{model._meta.model_name}.{counter}: расхождений {fixed}.'
+            )
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING('Найдены расхождения.'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'Найдены расхождения, счётчики исправлены.'
+            ))
@@ -0,0 +1,176 @@
+# Generated by Django 3.2.16 on 2026-10-18 01:38
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_FORWARD = """
+CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM recipes_recipeingredient ri
+            JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = NEW.id
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_search_vector
+BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update();
+
+CREATE FUNCTION recipes_recipeingredient_search_vector_update()
+RETURNS trigger AS $$
+BEGIN
+    UPDATE recipes_recipe SET name = name
+    WHERE id = CASE WHEN TG_OP = 'DELETE'
+        THEN OLD.recipe_id ELSE NEW.recipe_id END;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipeingredient_search_vector
+AFTER INSERT OR UPDATE OR DELETE ON recipes_recipeingredient
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipeingredient_search_vector_update();
+
+UPDATE recipes_recipe SET name = name;
+"""
+
+POSTGRESQL_BACKWARD = """
+DROP TRIGGER recipes_recipeingredient_search_vector
+ON recipes_recipeingredient;
+DROP FUNCTION recipes_recipeingredient_search_vector_update();
+DROP TRIGGER recipes_recipe_search_vector ON recipes_recipe;
+DROP FUNCTION recipes_recipe_search_vector_update();
+"""
+
+SQLITE_INGREDIENTS = """(
+    SELECT coalesce(group_concat(i.name, ' '), '')
+    FROM recipes_recipeingredient ri
+    JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+    WHERE ri.recipe_id = {}
+)"""
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, ingredients, text, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_insert AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text)
+        VALUES (NEW.id, NEW.name, {}, NEW.text);
+    END
+    """.format(SQLITE_INGREDIENTS.format('NEW.id')),
+    """
+    CREATE TRIGGER recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        UPDATE recipes_recipe_fts SET name = NEW.name, text = NEW.text
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_delete AFTER DELETE ON recipes_recipe
+    BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipeingredient_fts_insert
+    AFTER INSERT ON recipes_recipeingredient
+    BEGIN
+        UPDATE recipes_recipe_fts SET ingredients = {}
+        WHERE rowid = NEW.recipe_id;
+    END
+    """.format(SQLITE_INGREDIENTS.format('NEW.recipe_id')),
+    """
+    CREATE TRIGGER recipes_recipeingredient_fts_update
+    AFTER UPDATE ON recipes_recipeingredient
+    BEGIN
+        UPDATE recipes_recipe_fts SET ingredients = {}
+        WHERE rowid IN (OLD.recipe_id, NEW.recipe_id);
+    END
+    """.format(SQLITE_INGREDIENTS.format('recipes_recipe_fts.rowid')),
+    """
+    CREATE TRIGGER recipes_recipeingredient_fts_delete
+    AFTER DELETE ON recipes_recipeingredient
+    BEGIN
+        UPDATE recipes_recipe_fts SET ingredients = {}
+        WHERE rowid = OLD.recipe_id;
+    END
+    """.format(SQLITE_INGREDIENTS.format('OLD.recipe_id')),
+    """
+    INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text)
+    SELECT r.id, r.name, {}, r.text FROM recipes_recipe r
+    """.format(SQLITE_INGREDIENTS.format('r.id')),
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER recipes_recipeingredient_fts_delete',
+    'DROP TRIGGER recipes_recipeingredient_fts_update',
+    'DROP TRIGGER recipes_recipeingredient_fts_insert',
+    'DROP TRIGGER recipes_recipe_fts_delete',
+    'DROP TRIGGER recipes_recipe_fts_update',
+    'DROP TRIGGER recipes_recipe_fts_insert',
+    'DROP TABLE recipes_recipe_fts',
+]
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['search_vector'], name='recipe_search_idx'
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        recipe = apps.get_model('recipes', 'Recipe')
+        schema_editor.add_index(recipe, SEARCH_INDEX)
+        schema_editor.execute(POSTGRESQL_FORWARD)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_FORWARD:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_BACKWARD)
+        recipe = apps.get_model('recipes', 'Recipe')
+        schema_editor.remove_index(recipe, SEARCH_INDEX)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_BACKWARD:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=SEARCH_INDEX,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:39
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копия recipes.units.UNIT_CONVERSIONS на момент миграции: дальнейшие
+# правки таблицы не должны менять то, что делает эта миграция.
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def fill_measurement_units(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    MeasurementUnit = apps.get_model('recipes', 'MeasurementUnit')
+    names = set(
+        Ingredient.objects.order_by().values_list(
+            'measurement_unit', flat=True
+        ).distinct()
+    )
+    names |= {
+        UNIT_CONVERSIONS[name][0] for name in names & UNIT_CONVERSIONS.keys()
+    }
+    MeasurementUnit.objects.bulk_create(
+        MeasurementUnit(
+            name=name,
+            base_id=UNIT_CONVERSIONS.get(name, (None, 1))[0],
+            factor=UNIT_CONVERSIONS.get(name, (None, 1))[1],
+        )
+        for name in sorted(names)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Единица измерения')),
+                ('factor', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Базовых единиц в единице')),
+                ('base', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='derived_units', to='recipes.measurementunit', to_field='name', verbose_name='Базовая единица')),
+            ],
+            options={
+                'verbose_name': 'Единица измерения',
+                'verbose_name_plural': 'Единицы измерения',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.RunPython(
+            fill_measurement_units, migrations.RunPython.noop
+        ),
+    ]
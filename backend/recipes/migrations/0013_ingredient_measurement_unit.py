@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Триггеры FTS5, которые ссылаются на recipes_ingredient и не дают
+# SQLite переименовать пересозданную таблицу. Их восстанавливает
+# обработчик post_migrate из recipes.signals.
+SQLITE_TRIGGERS = (
+    'recipes_recipe_fts_insert',
+    'recipes_recipeingredient_fts_insert',
+    'recipes_recipeingredient_fts_update',
+    'recipes_recipeingredient_fts_delete',
+)
+
+
+def drop_sqlite_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in SQLITE_TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_measurementunit'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_triggers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='measurement_unit',
+            field=models.ForeignKey(db_column='measurement_unit', on_delete=django.db.models.deletion.PROTECT, related_name='ingredients', to='recipes.measurementunit', to_field='name', verbose_name='Единицы измерения'),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, drop_sqlite_triggers),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:10
+
+from django.db import migrations
+
+POSTGRESQL_FORWARD = """
+DROP TRIGGER recipes_recipeingredient_search_vector
+ON recipes_recipeingredient;
+DROP FUNCTION recipes_recipeingredient_search_vector_update();
+
+CREATE FUNCTION recipes_recipeingredient_search_vector_update()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE recipes_recipe SET name = name
+        WHERE id IN (SELECT recipe_id FROM new_rows);
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE recipes_recipe SET name = name
+        WHERE id IN (
+            SELECT recipe_id FROM new_rows
+            UNION SELECT recipe_id FROM old_rows
+        );
+    ELSE
+        UPDATE recipes_recipe SET name = name
+        WHERE id IN (SELECT recipe_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipeingredient_search_vector_insert
+AFTER INSERT ON recipes_recipeingredient
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE PROCEDURE recipes_recipeingredient_search_vector_update();
+
+CREATE TRIGGER recipes_recipeingredient_search_vector_update
+AFTER UPDATE ON recipes_recipeingredient
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE PROCEDURE recipes_recipeingredient_search_vector_update();
+
+CREATE TRIGGER recipes_recipeingredient_search_vector_delete
+AFTER DELETE ON recipes_recipeingredient
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE PROCEDURE recipes_recipeingredient_search_vector_update();
+
+CREATE FUNCTION recipes_ingredient_search_vector_update()
+RETURNS trigger AS $$
+BEGIN
+    UPDATE recipes_recipe SET name = name
+    WHERE id IN (
+        SELECT ri.recipe_id
+        FROM recipes_recipeingredient ri
+        JOIN new_rows n ON n.id = ri.ingredient_id
+        JOIN old_rows o ON o.id = n.id
+        WHERE n.name IS DISTINCT FROM o.name
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_ingredient_search_vector
+AFTER UPDATE ON recipes_ingredient
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE PROCEDURE recipes_ingredient_search_vector_update();
+"""
+
+POSTGRESQL_BACKWARD = """
+DROP TRIGGER recipes_ingredient_search_vector ON recipes_ingredient;
+DROP FUNCTION recipes_ingredient_search_vector_update();
+DROP TRIGGER recipes_recipeingredient_search_vector_delete
+ON recipes_recipeingredient;
+DROP TRIGGER recipes_recipeingredient_search_vector_update
+ON recipes_recipeingredient;
+DROP TRIGGER recipes_recipeingredient_search_vector_insert
+ON recipes_recipeingredient;
+DROP FUNCTION recipes_recipeingredient_search_vector_update();
+
+CREATE FUNCTION recipes_recipeingredient_search_vector_update()
+RETURNS trigger AS $$
+BEGIN
+    UPDATE recipes_recipe SET name = name
+    WHERE id = CASE WHEN TG_OP = 'DELETE'
+        THEN OLD.recipe_id ELSE NEW.recipe_id END;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipeingredient_search_vector
+AFTER INSERT OR UPDATE OR DELETE ON recipes_recipeingredient
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipeingredient_search_vector_update();
+"""
+
+
+def statement_triggers(apps, schema_editor):
+    """
+    Построчный триггер из 0003 пересчитывал вектор рецепта на каждую
+    строку состава. Триггеры уровня оператора с таблицами переходов
+    пересчитывают каждый затронутый рецепт один раз, а переименование
+    ингредиента теперь тоже попадает в вектор.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_FORWARD)
+
+
+def row_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_ingredient_measurement_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(statement_triggers, row_triggers),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_search_vector_statement_triggers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='similar_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия для похожих рецептов'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:55
+
+from django.db import migrations
+
+POSTGRESQL_FUNCTION = """
+CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', {name}), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg({ingredient}, ' ')
+            FROM recipes_recipeingredient ri
+            JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = NEW.id
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', {text}), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+UPDATE recipes_recipe SET name = name;
+"""
+
+POSTGRESQL_FORWARD = POSTGRESQL_FUNCTION.format(
+    name="translate(coalesce(NEW.name, ''), 'ёЁ', 'еЕ')",
+    ingredient="translate(i.name, 'ёЁ', 'еЕ')",
+    text="translate(coalesce(NEW.text, ''), 'ёЁ', 'еЕ')",
+)
+
+POSTGRESQL_BACKWARD = POSTGRESQL_FUNCTION.format(
+    name="coalesce(NEW.name, '')",
+    ingredient='i.name',
+    text="coalesce(NEW.text, '')",
+)
+
+# Триггеры FTS5 с текстом рецепта. recipes.signals.
+# restore_sqlite_search_index создаёт их заново по recipes.fts
+# и перестраивает индекс после миграций.
+SQLITE_TRIGGERS = (
+    'recipes_recipe_fts_insert',
+    'recipes_recipe_fts_update',
+    'recipes_recipeingredient_fts_insert',
+    'recipes_recipeingredient_fts_update',
+    'recipes_recipeingredient_fts_delete',
+    'recipes_ingredient_fts_update',
+)
+
+
+def drop_sqlite_triggers(schema_editor):
+    for name in SQLITE_TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def fold_yo(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_FORWARD)
+    elif vendor == 'sqlite':
+        drop_sqlite_triggers(schema_editor)
+
+
+def unfold_yo(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_BACKWARD)
+    elif vendor == 'sqlite':
+        drop_sqlite_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_feeditem_pub_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_yo, unfold_yo),
+    ]
@@ -1,9 +1,23 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVectorField
+)
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.expressions import RawSQL
 
 from core.enums import Length
-from users.models import User
+from core.models import BackgroundFieldsMixin
+from users.models import Subscription, User
+
+SEARCH_CONFIG = 'russian'
+SEARCH_FTS_TABLE = 'recipes_recipe_fts'
+
+
+def fold_search_text(value):
+    """В поиске ё не отличается от е, как в автодополнении."""
+    return value.replace('ё', 'е').replace('Ё', 'Е')
 
 
 class Tag(models.Model):
@@ -33,15 +47,56 @@ class Tag(models.Model):
         return self.name
 
 
+class MeasurementUnit(models.Model):
+    """
+    Единица измерения и её перевод в базовую единицу.
+
+    Количество в базовых единицах - количество, умноженное на factor.
+    У базовых единиц base не задан, а factor равен 1.
+    """
+
+    name = models.CharField(
+        verbose_name='Единица измерения',
+        max_length=Length.MAX_LEN_MEASUREMENT_UNIT.value,
+        unique=True,
+    )
+    base = models.ForeignKey(
+        'self',
+        verbose_name='Базовая единица',
+        related_name='derived_units',
+        to_field='name',
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+    )
+    factor = models.PositiveIntegerField(
+        verbose_name='Базовых единиц в единице',
+        default=1,
+        validators=(MinValueValidator(1),),
+    )
+
+    class Meta:
+        verbose_name = 'Единица измерения'
+        verbose_name_plural = 'Единицы измерения'
+        ordering = ('name',)
+
+    def __str__(self):
+        return self.name
+
+
 class Ingredient(models.Model):
 
     name = models.CharField(
         verbose_name='Ингредиент',
         max_length=Length.MAX_LEN_RECIPES_CHARFIELD.value,
     )
-    measurement_unit = models.CharField(
+    measurement_unit = models.ForeignKey(
+        MeasurementUnit,
         verbose_name='Единицы измерения',
-        max_length=Length.MAX_LEN_MEASUREMENT_UNIT.value,
+        related_name='ingredients',
+        to_field='name',
+        db_column='measurement_unit',
+        on_delete=models.PROTECT,
     )
 
     class Meta:
@@ -54,7 +109,106 @@ class Ingredient(models.Model):
         ]
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует флаги избранного, корзины и подписки на автора
+        для пользователя.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                author_is_subscribed=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            author_is_subscribed=models.Exists(
+                Subscription.objects.filter(
+                    user=user, author=models.OuterRef('author')
+                )
+            ),
+        )
+
+    def search(self, query):
+        """
+        Полнотекстовый поиск по названию, описанию и ингредиентам.
+
+        В PostgreSQL используется поле search_vector с GIN-индексом,
+        в SQLite - теневая таблица FTS5. Оба индекса поддерживаются
+        триггерами из миграций 0003 и 0017; ё в индексе и в запросе
+        заменяется на е. Результаты упорядочены по
+        релевантности в аннотации search_rank.
+        """
+        ordering = ('-search_rank', *Recipe._meta.ordering)
+        query = fold_search_text(query)
+        if connections[self.db].vendor == 'postgresql':
+            search_query = SearchQuery(
+                query, config=SEARCH_CONFIG, search_type='websearch'
+            )
+            return self.filter(search_vector=search_query).annotate(
+                search_rank=SearchRank(
+                    models.F('search_vector'), search_query
+                )
+            ).order_by(*ordering)
+        terms = ' '.join(
+            '"{}"*'.format(term.replace('"', '""'))
+            for term in query.split()
+        )
+        if not terms:
+            return self
+        quote = connections[self.db].ops.quote_name
+        fts = quote(SEARCH_FTS_TABLE)
+        return self.filter(
+            id__in=RawSQL(
+                f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', (terms,)
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT -bm25({fts}, 10.0, 5.0, 1.0) FROM {fts} '
+                f'WHERE {fts} MATCH %s AND rowid = '
+                f'{quote(Recipe._meta.db_table)}.{quote("id")}',
+                (terms,)
+            )
+        ).order_by(*ordering)
+
+    def mark_similar_stale(self):
+        """
+        Помечает похожие рецепты устаревшими для build_similar_recipes.
+
+        similar_version растёт с каждой пометкой: команда снимает флаг
+        только с тех рецептов, версия которых не изменилась с начала
+        пересчёта.
+        """
+        return self.update(
+            similar_stale=True,
+            similar_version=models.F('similar_version') + 1,
+        )
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
+class Recipe(BackgroundFieldsMixin, models.Model):
 
     name = models.CharField(
         verbose_name='Рецепт',
@@ -89,18 +243,86 @@ class Recipe(models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
     )
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True,
         editable=False,
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
+    image_variants = models.JSONField(
+        verbose_name='Варианты изображения',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    fanned_out = models.BooleanField(
+        verbose_name='Разослан по лентам подписчиков',
+        default=False,
+        editable=False,
+    )
+    similar_stale = models.BooleanField(
+        verbose_name='Похожие рецепты устарели',
+        default=True,
+        editable=False,
+    )
+    similar_version = models.PositiveIntegerField(
+        verbose_name='Версия для похожих рецептов',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeManager()
+
+    background_fields = (
+        'favorites_count', 'in_carts_count', 'image_variants',
+        'fanned_out', 'similar_stale', 'similar_version', 'search_vector',
+    )
 
     class Meta:
         default_related_name = 'recipes'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            GinIndex(fields=('search_vector',), name='recipe_search_idx'),
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('author',),
+                condition=models.Q(fanned_out=False),
+                name='recipe_not_fanned_out_idx'
+            ),
+            models.Index(
+                fields=('id',),
+                condition=models.Q(similar_stale=True),
+                name='recipe_similar_stale_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -160,12 +382,18 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         related_name='favorite_user',
         default=None,
+        db_index=False,
     )
 
     class Meta:
         verbose_name = 'Избранные рецепты'
         verbose_name_plural = 'Избранные рецепты'
         ordering = ('recipe',)
+        indexes = [
+            models.Index(
+                fields=('user', 'recipe'), name='favorite_user_recipe_idx'
+            ),
+        ]
         constraints = [models.UniqueConstraint(
             fields=('recipe', 'user'),
             name='unique_recipe')
@@ -188,6 +416,7 @@ class ShoppingCart(models.Model):
         verbose_name='Владелец списка покупок',
         on_delete=models.CASCADE,
         default=None,
+        db_index=False,
     )
 
     class Meta:
@@ -195,6 +424,12 @@ class ShoppingCart(models.Model):
         verbose_name_plural = 'Список покупок'
         default_related_name = 'shopping_cart'
         ordering = ('recipe',)
+        indexes = [
+            models.Index(
+                fields=('user', 'recipe'),
+                name='shopping_cart_user_recipe_idx'
+            ),
+        ]
         constraints = [models.UniqueConstraint(
             fields=('recipe', 'user'),
             name='unique_shopping_cart')
@@ -202,3 +437,268 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Подписчик',
+        related_name='feed',
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='feed_items',
+        on_delete=models.CASCADE,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+        editable=False,
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [models.UniqueConstraint(
+            fields=('user', 'recipe'),
+            name='unique_feed_item')
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_item_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+
+class SimilarRecipe(models.Model):
+    """Один из ближайших по ингредиентам рецептов."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='similar_recipes',
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        related_name='similar_to',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'), name='similar_recipe_score_idx'
+            ),
+        ]
+        constraints = [models.UniqueConstraint(
+            fields=('recipe', 'similar'),
+            name='unique_similar_recipe')
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def apply_amounts(self, user_ids, amounts):
+        """
+        Прибавляет количества ингредиентов к спискам покупок.
+
+        amounts - словарь {id ингредиента: изменение количества},
+        отрицательные значения вычитаются. Строки с нулевым
+        итогом удаляются.
+        """
+        user_ids = list(user_ids)
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        with transaction.atomic(using=self.db):
+            existing = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.select_for_update().filter(
+                    user_id__in=user_ids, ingredient_id__in=amounts
+                )
+            }
+            to_create, to_update, to_delete = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, amount in amounts.items():
+                    item = existing.get((user_id, ingredient_id))
+                    if item is None:
+                        if amount > 0:
+                            to_create.append(self.model(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                total_amount=amount,
+                            ))
+                        continue
+                    item.total_amount += amount
+                    if item.total_amount > 0:
+                        to_update.append(item)
+                    else:
+                        to_delete.append(item.id)
+            self.bulk_create(to_create)
+            self.bulk_update(to_update, ('total_amount',))
+            if to_delete:
+                self.filter(id__in=to_delete).delete()
+
+    def apply_recipe(self, user_ids, recipe, sign=1):
+        """Добавляет (sign=1) или убирает (sign=-1) ингредиенты рецепта."""
+        self.apply_amounts(user_ids, {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in recipe.ingredients_recipe.values_list(
+                'ingredient_id', 'amount'
+            )
+        })
+
+    def apply_recipes(self, user_ids, recipe_ids, sign=1):
+        """Как apply_recipe, но для нескольких рецептов одним запросом."""
+        self.apply_amounts(user_ids, {
+            ingredient_id: sign * total
+            for ingredient_id, total in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by().values('ingredient_id').annotate(
+                total=models.Sum('amount')
+            ).values_list('ingredient_id', 'total')
+        })
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Владелец списка покупок',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        ordering = ('user',)
+        constraints = [models.UniqueConstraint(
+            fields=('user', 'ingredient'),
+            name='unique_shopping_list_item')
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.total_amount} {self.ingredient}'
+
+
+class ExportJob(models.Model):
+    """Задание на выгрузку в очереди run_export_worker."""
+
+    SHOPPING_LIST = 'shopping_list'
+    COOKBOOK = 'cookbook'
+    KINDS = [
+        (SHOPPING_LIST, 'Список покупок'),
+        (COOKBOOK, 'Избранные рецепты'),
+    ]
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='export_jobs',
+        on_delete=models.CASCADE,
+    )
+    kind = models.CharField(
+        verbose_name='Тип выгрузки',
+        max_length=Length.MAX_LENGTH_EXPORT_FIELD.value,
+        choices=KINDS,
+    )
+    format = models.CharField(
+        verbose_name='Формат',
+        max_length=Length.MAX_LENGTH_EXPORT_FIELD.value,
+    )
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=Length.MAX_LENGTH_EXPORT_FIELD.value,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    fingerprint = models.CharField(
+        verbose_name='Отпечаток данных',
+        max_length=Length.MAX_LENGTH_FINGERPRINT.value,
+    )
+    file = models.FileField(
+        verbose_name='Файл',
+        upload_to='exports/',
+        blank=True,
+    )
+    error = models.TextField(
+        verbose_name='Ошибка',
+        blank=True,
+    )
+    created = models.DateTimeField(
+        verbose_name='Создано',
+        auto_now_add=True,
+    )
+    started = models.DateTimeField(
+        verbose_name='Начато',
+        null=True,
+        blank=True,
+    )
+    finished = models.DateTimeField(
+        verbose_name='Завершено',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Выгрузка'
+        verbose_name_plural = 'Выгрузки'
+        ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=('status', 'created'), name='export_job_queue_idx'
+            ),
+        ]
+        constraints = [models.UniqueConstraint(
+            fields=('user', 'fingerprint'),
+            condition=~models.Q(status='failed'),
+            name='unique_export_job')
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.kind} ({self.status})'
@@ -0,0 +1,168 @@
+from collections import Counter, defaultdict
+
+from django.db import connections, transaction
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from .feed import backfill, fan_out, prune
+from .fts import ensure_sqlite_search_index
+from .images import generate_variants_in_background, needs_variants
+from .models import (
+    Favorite, Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem
+)
+from core.utils import change_counter
+from users.models import Subscription, User
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.apply_recipe(
+            (instance.user_id,), instance.recipe
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(instance, **kwargs):
+    """
+    Вычитает ингредиенты, которые остались у рецепта. При каскадном
+    удалении рецепта строки состава могут быть удалены раньше или
+    позже корзины; каждую из них вычитает ровно один из обработчиков:
+    этот или subtract_recipe_ingredient.
+    """
+    ShoppingListItem.objects.apply_recipes(
+        (instance.user_id,), (instance.recipe_id,), sign=-1
+    )
+
+
+def apply_to_carts(amounts):
+    """
+    Меняет списки покупок всех, у кого рецепт в корзине.
+
+    amounts - {id рецепта: {id ингредиента: изменение количества}}.
+    """
+    for recipe_id, recipe_amounts in amounts.items():
+        ShoppingListItem.objects.apply_amounts(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('user_id', flat=True),
+            recipe_amounts
+        )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(instance, **kwargs):
+    instance.previous_row = None if instance.pk is None else (
+        RecipeIngredient.objects.filter(pk=instance.pk).values_list(
+            'recipe_id', 'ingredient_id', 'amount'
+        ).first()
+    )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def add_recipe_ingredient(instance, **kwargs):
+    """
+    Правки состава через ORM (в том числе в админке) попадают в списки
+    покупок. bulk_create и bulk_update сигналов не шлют, их изменения
+    вносит RecipePostSerializer.
+    """
+    amounts = defaultdict(Counter)
+    previous = getattr(instance, 'previous_row', None)
+    if previous is not None:
+        recipe_id, ingredient_id, amount = previous
+        amounts[recipe_id][ingredient_id] -= amount
+    amounts[instance.recipe_id][instance.ingredient_id] += instance.amount
+    apply_to_carts(amounts)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def subtract_recipe_ingredient(instance, **kwargs):
+    apply_to_carts(
+        {instance.recipe_id: {instance.ingredient_id: -instance.amount}}
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_variants(instance, **kwargs):
+    if needs_variants(instance):
+        transaction.on_commit(
+            lambda: generate_variants_in_background(instance.id)
+        )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            RECIPE_COUNTERS[sender], 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        RECIPE_COUNTERS[sender], -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def prune_feed(instance, **kwargs):
+    prune(instance.user_id, instance.author_id)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def mark_similar_stale(instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).mark_similar_stale()
+
+
+@receiver(pre_delete, sender=Recipe)
+def mark_neighbours_similar_stale(instance, **kwargs):
+    """Списки, где был удаляемый рецепт, пересчитает build_similar_recipes."""
+    Recipe.objects.filter(
+        similar_recipes__similar=instance
+    ).mark_similar_stale()
+
+
+@receiver(post_migrate)
+def restore_sqlite_search_index(sender, using, **kwargs):
+    connection = connections[using]
+    if sender.name == 'recipes' and connection.vendor == 'sqlite':
+        ensure_sqlite_search_index(connection)
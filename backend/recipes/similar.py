@@ -0,0 +1,61 @@
+import heapq
+from collections import Counter, defaultdict
+
+from .models import RecipeIngredient
+
+
+def load_vectors():
+    """Разреженные векторы рецепт x ингредиент: множества id ингредиентов."""
+    vectors = defaultdict(set)
+    for recipe_id, ingredient_id in RecipeIngredient.objects.order_by(
+    ).values_list('recipe_id', 'ingredient_id').iterator():
+        vectors[recipe_id].add(ingredient_id)
+    return vectors
+
+
+class SimilarityIndex:
+    """
+    Инвертированный индекс ингредиент -> рецепты.
+
+    Сходство - коэффициент Жаккара по множествам ингредиентов,
+    считается только для рецептов с общими ингредиентами. Ингредиенты
+    из большей, чем max_df, доли рецептов (соль, вода) кандидатов
+    не порождают, но в коэффициенте учитываются.
+    """
+
+    def __init__(self, vectors, max_df):
+        self.vectors = vectors
+        limit = max(1, int(len(vectors) * max_df))
+        postings = defaultdict(list)
+        for recipe_id, ingredients in vectors.items():
+            for ingredient_id in ingredients:
+                postings[ingredient_id].append(recipe_id)
+        self.postings = {
+            ingredient_id: recipe_ids
+            for ingredient_id, recipe_ids in postings.items()
+            if len(recipe_ids) <= limit
+        }
+
+    def scores(self, recipe_id):
+        ingredients = self.vectors.get(recipe_id, set())
+        overlap = Counter()
+        for ingredient_id in ingredients:
+            overlap.update(self.postings.get(ingredient_id, ()))
+        overlap.pop(recipe_id, None)
+        frequent = ingredients - self.postings.keys()
+        scores = {}
+        for candidate, shared in overlap.items():
+            vector = self.vectors[candidate]
+            if frequent:
+                shared += len(frequent & vector)
+            scores[candidate] = shared / (
+                len(ingredients) + len(vector) - shared
+            )
+        return scores
+
+
+def top(scores, count):
+    """count лучших пар (id, сходство), при равенстве - более новые."""
+    return heapq.nlargest(
+        count, scores.items(), key=lambda item: (item[1], item[0])
+    )
@@ -0,0 +1,28 @@
+from .models import MeasurementUnit
+
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def create_units(names):
+    """
+    Добавляет в справочник недостающие единицы измерения.
+
+    Для единиц из UNIT_CONVERSIONS заодно создаются их базовые
+    единицы. Уже существующие единицы не меняются.
+    """
+    units = {}
+    for name in names:
+        base, factor = UNIT_CONVERSIONS.get(name, (None, 1))
+        units[name] = (base, factor)
+        if base is not None:
+            units.setdefault(base, (None, 1))
+    MeasurementUnit.objects.bulk_create(
+        (
+            MeasurementUnit(name=name, base_id=base, factor=factor)
+            for name, (base, factor) in sorted(units.items())
+        ),
+        ignore_conflicts=True,
+    )
@@ -8,7 +8,10 @@ from .models import (
 
 @admin.register(User)
 class UserAdmin(UserAdmin):
-    pass
+    readonly_fields = ('recipes_count', 'followers_count')
+    fieldsets = UserAdmin.fieldsets + (
+        ('Счётчики', {'fields': readonly_fields}),
+    )
 
 
 @admin.register(Subscription)
@@ -5,9 +5,10 @@ from django.db import models
 
 from api.validators import validate_username
 from core.enums import Length
+from core.models import BackgroundFieldsMixin
 
 
-class User(AbstractUser):
+class User(BackgroundFieldsMixin, AbstractUser):
     """Модель пользователя."""
 
     ADMIN = 'admin'
@@ -52,8 +53,19 @@ class User(AbstractUser):
         choices=USER_ROLES,
         default=USER
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
+    background_fields = ('recipes_count', 'followers_count')
     REQUIRED_FIELDS = (
         'username',
         'first_name',